@@ -5,8 +5,15 @@ if "bpy" in locals():
     importlib.reload(utils)
     importlib.reload(nodeutils)
     importlib.reload(cc3)
+    importlib.reload(packer)
+    importlib.reload(bakecache)
+    importlib.reload(dedup)
+    importlib.reload(profiler)
+    importlib.reload(writer)
     importlib.reload(prefs)
     importlib.reload(bake)
+    importlib.reload(farm)
+    importlib.reload(cli)
 
 import bpy
 from . import addon_updater_ops
@@ -14,8 +21,15 @@ from . import vars
 from . import utils
 from . import nodeutils
 from . import cc3
+from . import packer
+from . import bakecache
+from . import dedup
+from . import profiler
+from . import writer
 from . import prefs
 from . import bake
+from . import farm
+from . import cli
 
 bl_info = {
     "name": "CC/iC Baking Tool",
@@ -37,6 +51,8 @@ CLASSES = (bake.CC3BakeCache, bake.CC3BakeSettings, bake.CC3BakeMaterialSettings
             prefs.CC3BakeAddonPreferences
             )
 
+MATERIAL_INDEX_HANDLERS = (bpy.app.handlers.load_post, bpy.app.handlers.undo_post, bpy.app.handlers.redo_post)
+
 def register():
     addon_updater_ops.register(bl_info)
 
@@ -44,6 +60,11 @@ def register():
         bpy.utils.register_class(cls)
     bpy.types.Scene.CC3BakeProps = bpy.props.PointerProperty(type=bake.CC3BakeProps)
 
+    for handlers in MATERIAL_INDEX_HANDLERS:
+        handlers.append(bake.clear_material_indexes)
+        handlers.append(cc3.clear_material_cache_index)
+        handlers.append(nodeutils.clear_node_indexes)
+
 def unregister():
     addon_updater_ops.unregister()
 
@@ -51,6 +72,14 @@ def unregister():
         bpy.utils.unregister_class(cls)
     del(bpy.types.Scene.CC3BakeProps)
 
+    for handlers in MATERIAL_INDEX_HANDLERS:
+        if bake.clear_material_indexes in handlers:
+            handlers.remove(bake.clear_material_indexes)
+        if cc3.clear_material_cache_index in handlers:
+            handlers.remove(cc3.clear_material_cache_index)
+        if nodeutils.clear_node_indexes in handlers:
+            handlers.remove(nodeutils.clear_node_indexes)
+
 
 
 
@@ -1,24 +1,222 @@
 import bpy
 import os
+import time
+import operator
 import mathutils
 from . import addon_updater_ops
 from . import utils
 from . import nodeutils
 from . import cc3
 from . import vars
+from . import packer
+from . import bakecache
+from . import dedup
+from . import farm
+from . import profiler
+from . import writer
 
 
 def make_new_image(name, size, format, ext, dir, data, alpha):
+    """Makes a new image, in memory only, with the file path and format it will be saved with.
+
+    Nothing is written until all the baking and packing is done (see write_pending_images),
+    so there is only one encode and write of each new image.
+    """
     img = bpy.data.images.new(name, size, size, alpha=alpha, is_data=data)
-    img.pixels[0] = 0
     img.file_format = format
     dir = os.path.join(bpy.path.abspath("//"), dir)
     os.makedirs(dir, exist_ok=True)
     img.filepath_raw = os.path.join(dir, name + ext)
-    img.save()
+    register_image(img)
+    return img
+
+
+# image pointer: [image, bake cache key] of the baked, copied and packed images,
+# written once all the post processing is done
+pending_writes = {}
+# the image encodes and decodes of the bake run
+image_io = { "encode": 0, "decode": 0 }
+
+
+def clear_image_io():
+    image_io["encode"] = 0
+    image_io["decode"] = 0
+
+
+def queue_image_write(image, bake_key = None):
+    """Writes the image (once) after all the baking and packing, the pixels stay in memory until then."""
+    entry = pending_writes.get(image.as_pointer())
+    if entry:
+        if bake_key:
+            entry[1] = bake_key
+    else:
+        pending_writes[image.as_pointer()] = [image, bake_key]
+
+
+# the background image writer of the bake run, or None to write on the main thread
+image_writer = None
+# [image, bake cache key, future or None] of the images written or being written
+written_images = []
+
+
+def can_write_async(image):
+    """Only 8 bit PNGs are encoded on the background threads, anything else is saved by Blender."""
+    return (image_writer is not None and image.file_format == "PNG" and
+            not image.is_float and (image.depth == 24 or image.depth == 32))
+
+
+def save_image(image):
+    """Saves the image on the main thread.
+
+    8 bit images in the target format are saved with the scene's image settings, the JPEG quality and
+    PNG compression set by BakeSession, with the color mode and depth of the image.
+    Anything else (i.e. the PNG alpha packs of a JPEG target, or float images) is saved in its own format,
+    the scene settings would convert it.
+    """
+    settings = bpy.context.scene.render.image_settings
+    if image.is_float or image.file_format != settings.file_format:
+        image.save()
+        return
+    color_mode = "RGBA" if image.depth == 32 else "BW" if image.depth == 8 else "RGB"
+    if color_mode == "RGBA" and settings.file_format == "JPEG":
+        color_mode = "RGB"
+    snapshot = []
+    for attr, value in (("color_mode", color_mode), ("color_depth", "8")):
+        try:
+            old_value = getattr(settings, attr)
+            setattr(settings, attr, value)
+            snapshot.append([attr, old_value])
+        except:
+            pass
+    try:
+        image.save_render(filepath = bpy.path.abspath(image.filepath_raw), scene = bpy.context.scene)
+    finally:
+        for attr, old_value in snapshot:
+            setattr(settings, attr, old_value)
+
+
+def write_image(image, bake_key):
+    props = bpy.context.scene.CC3BakeProps
+    future = None
+    if can_write_async(image):
+        # the pixels are read here, the encoding and writing happen on the writer threads
+        with profiler.span("write queue", size=image.size[0]):
+            future = image_writer.submit_png(bpy.path.abspath(image.filepath_raw), packer.get_image_pixels(image),
+                                             image.size[0], image.size[1], image.channels,
+                                             4 if image.depth == 32 else 3, props.png_compression)
+    else:
+        with profiler.span("write", size=image.size[0]):
+            save_image(image)
+            if profiler.enabled:
+                profiler.add_args(bytes=profiler.get_file_size(bpy.path.abspath(image.filepath_raw)))
+    image_io["encode"] += 1
+    written_images.append([image, bake_key, future])
+
+
+def write_pending_images():
+    """Starts writing the pending images, except those still waiting to be packed."""
+    packing = set([job.image.as_pointer() for job in pack_jobs])
+    for key in list(pending_writes.keys()):
+        if key not in packing:
+            image, bake_key = pending_writes.pop(key)
+            write_image(image, bake_key)
+
+
+def finish_image_writes():
+    """Waits for all the image writes and points the written images at their files.
+
+    Raises an exception naming every image that failed to write.
+    """
+    props = bpy.context.scene.CC3BakeProps
+    errors = []
+    with profiler.span("write wait"):
+        for image, bake_key, future in written_images:
+            if future:
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append(image.name + ": " + str(e))
+                    continue
+            # a new image is only generated in memory until its first save, point it at the saved file:
+            if image.source == "GENERATED":
+                image.source = "FILE"
+            if props.reload_images:
+                with profiler.span("reload", size=image.size[0]):
+                    image.reload()
+                image_io["decode"] += 1
+            store_cached_bake(image, bake_key)
+    written_images.clear()
+    if errors:
+        raise Exception("Unable to write baked images: " + ", ".join(errors))
+
+
+# image name: image, built once per bake run and kept up to date as images are made and removed
+image_registry = None
+# path: normalized real path
+normalized_paths = {}
+
+
+def clear_image_registry():
+    global image_registry
+    image_registry = None
+    normalized_paths.clear()
+
+
+def get_image_registry():
+    global image_registry
+    if image_registry is None:
+        image_registry = {}
+        for img in bpy.data.images:
+            image_registry[img.name] = img
+    return image_registry
+
+
+def get_registered_image(name):
+    registry = get_image_registry()
+    img = registry.get(name)
+    if img is not None:
+        try:
+            if img.name != name:
+                # renamed since registered
+                del registry[name]
+                registry[img.name] = img
+                img = None
+        except ReferenceError:
+            # removed since registered
+            del registry[name]
+            img = None
     return img
 
 
+def register_image(img):
+    if image_registry is not None:
+        image_registry[img.name] = img
+
+
+def remove_image(img):
+    if image_registry is not None and image_registry.get(img.name) == img:
+        del image_registry[img.name]
+    pending_writes.pop(img.as_pointer(), None)
+    written_images[:] = [w for w in written_images if w[0] != img]
+    bpy.data.images.remove(img)
+
+
+def normalize_path(path):
+    """Returns the normalized real path, cached for the bake run to save the file system calls."""
+    norm = normalized_paths.get(path)
+    if norm is None:
+        try:
+            norm = os.path.normcase(os.path.realpath(bpy.path.abspath(path)))
+        except:
+            norm = path
+        normalized_paths[path] = norm
+    return norm
+
+
+def is_same_path(path_a, path_b):
+    return normalize_path(path_a) == normalize_path(path_b)
+
+
 def get_image_format():
     props = bpy.context.scene.CC3BakeProps
     format = props.target_format
@@ -61,30 +259,24 @@ def make_image_target(nodes, name, size, data = True, alpha = False):
     path = get_bake_path()
 
     # find an old image with the same name to reuse:
-    for img in bpy.data.images:
-        if img.name.startswith(name) and img.name.endswith(name):
+    img = get_registered_image(name)
+    if img:
+        img_path, img_file = os.path.split(img.filepath)
+        same_path = is_same_path(path, img_path)
 
-            img_path, img_file = os.path.split(img.filepath)
-            same_path = False
+        if img.file_format == format and img.depth == depth and same_path:
+            utils.log_info("Reusing image: " + name)
             try:
-                if os.path.samefile(path, img_path):
-                    same_path = True
+                if img.size[0] != size or img.size[1] != size:
+                    utils.log_info("Scaling image: " + name + " to: " + str(size))
+                    img.scale(size, size)
+                return img
             except:
-                same_path = False
-
-            if img.file_format == format and img.depth == depth and same_path:
-                utils.log_info("Reusing image: " + name)
-                try:
-                    if img.size[0] != size or img.size[1] != size:
-                        utils.log_info("Scaling image: " + name + " to: " + str(size))
-                        img.scale(size, size)
-                    return img
-                except:
-                    utils.log_info("Bad image: " + img.name)
-                    bpy.data.images.remove(img)
-            else:
-                utils.log_info("Wrong path or format: " + img.name + ", " + img_path + "==" + path + "?, " + img.file_format + "==" + format + "?, depth: " + str(depth) + "==" + str(img.depth) + "?")
-                bpy.data.images.remove(img)
+                utils.log_info("Bad image: " + img.name)
+                remove_image(img)
+        else:
+            utils.log_info("Wrong path or format: " + img.name + ", " + img_path + "==" + path + "?, " + img.file_format + "==" + format + "?, depth: " + str(depth) + "==" + str(img.depth) + "?")
+            remove_image(img)
 
     # or just make a new one:
     utils.log_info("Creating new image: " + name + " size: " + str(size))
@@ -92,7 +284,7 @@ def make_image_target(nodes, name, size, data = True, alpha = False):
     return img
 
 
-def copy_image_target(image_node, name, size, data = True, alpha = False):
+def copy_image_target(image_node, name, size, data = True, alpha = False, map_suffix = None):
     props = bpy.context.scene.CC3BakeProps
 
     # return None if it's a bad image source
@@ -111,24 +303,17 @@ def copy_image_target(image_node, name, size, data = True, alpha = False):
     path = get_bake_path()
 
     # find an old image with the same name to reuse:
-    for img in bpy.data.images:
-        if img.name.startswith(name) and img.name.endswith(name):
-
-            img_path, img_file = os.path.split(img.filepath)
-            same_path = False
-            try:
-                if os.path.samefile(path, img_path):
-                    same_path = True
-            except:
-                same_path = False
-
-            if same_path:
-                utils.log_info("Removing existing copy: " + img.name)
-                bpy.data.images.remove(img)
+    img = get_registered_image(name)
+    if img:
+        img_path, img_file = os.path.split(img.filepath)
+        if is_same_path(path, img_path):
+            utils.log_info("Removing existing copy: " + img.name)
+            remove_image(img)
 
     utils.log_info("Copying existing image: " + image_node.image.name)
     img = image_node.image.copy()
     img.name = name
+    register_image(img)
     if img.size[0] != size or img.size[1] != size:
         utils.log_info("Resizing image: " + str(size))
         img.scale(size, size)
@@ -139,10 +324,16 @@ def copy_image_target(image_node, name, size, data = True, alpha = False):
         else:
             utils.log_info("Not changing image format of copy in Blender <= 2.93 (causes crash): " + format)
 
+    # don't save duplicates of an identical copy made for another material
+    canonical = dedup.get_canonical_image(img, map_suffix)
+    if canonical:
+        remove_image(img)
+        return canonical
+
     dir = os.path.join(bpy.path.abspath("//"), path)
     os.makedirs(dir, exist_ok=True)
     img.filepath_raw = os.path.join(dir, name + ext)
-    img.save()
+    queue_image_write(img)
 
     return img
 
@@ -158,7 +349,7 @@ def copy_target(source_mat, mat, source_node, source_socket, map_suffix, data):
 
     utils.log_info("Copying direct image source: " + source_node.name)
 
-    image = copy_image_target(source_node, mat_name + "_" + target_suffix, size, data)
+    image = copy_image_target(source_node, mat_name + "_" + target_suffix, size, data, map_suffix = map_suffix)
 
     # fall back to baking the source if we can't copy the image:
     if image is None and source_socket:
@@ -166,6 +357,8 @@ def copy_target(source_mat, mat, source_node, source_socket, map_suffix, data):
         return bake_target(source_mat, mat, source_node, source_socket, map_suffix, data)
 
     if image:
+        if not dedup.is_reused(image):
+            process_constant_map(image)
         image_node = nodeutils.make_image_node(nodes, image)
         image_node.name = vars.BAKE_PREFIX + mat_name + "_" + map_suffix
         return image_node
@@ -173,80 +366,124 @@ def copy_target(source_mat, mat, source_node, source_socket, map_suffix, data):
     return None
 
 
-old_samples = 64
-old_file_format = "PNG"
-old_quality = 90
-old_compression = 15
-old_view_transform = "Standard"
-old_look = "None"
-old_gamma = 1
-old_exposure = 0
-old_colorspace = "Raw"
-
-def prep_bake(width, height):
-    global old_samples, old_file_format, old_quality, old_compression
-    global old_view_transform, old_look, old_gamma, old_exposure, old_colorspace
-
-    old_samples = bpy.context.scene.cycles.samples
-    old_file_format = bpy.context.scene.render.image_settings.file_format
-    old_quality = bpy.context.scene.render.image_settings.quality
-    old_compression = bpy.context.scene.render.image_settings.compression
-    old_view_transform = bpy.context.scene.view_settings.view_transform
-    old_look = bpy.context.scene.view_settings.look
-    old_gamma = bpy.context.scene.view_settings.gamma
-    old_exposure = bpy.context.scene.view_settings.exposure
-    old_colorspace = bpy.context.scene.sequencer_colorspace_settings.name
+def process_constant_map(image):
+    """Shrinks the image to a tiny texture if every pixel has the same value.
+
+    The value is stored on the image in vars.CONSTANT_MAP_PROP, for packing and for
+    reconnect_material to fold into the BSDF input values.
+    """
+    props = bpy.context.scene.CC3BakeProps
+
+    if vars.CONSTANT_MAP_PROP in image:
+        del image[vars.CONSTANT_MAP_PROP]
+
+    if props.constant_maps == "FULL":
+        return
+
+    value = packer.get_constant_value(image, vars.CONSTANT_MAP_TOLERANCE)
+    if value is not None:
+        utils.log_info("Constant map: " + image.name + " value: " + str(value))
+        image[vars.CONSTANT_MAP_PROP] = value
+        if image.size[0] != vars.CONSTANT_MAP_SIZE or image.size[1] != vars.CONSTANT_MAP_SIZE:
+            image.scale(vars.CONSTANT_MAP_SIZE, vars.CONSTANT_MAP_SIZE)
+            queue_image_write(image)
+
 
+def is_constant_map(image):
+    return image is not None and vars.CONSTANT_MAP_PROP in image
+
+
+def get_bake_settings():
+    """Returns the [path, value] scene settings to bake with, in the order they are applied."""
     props = bpy.context.scene.CC3BakeProps
 
+    settings = [
+        ["render.engine", "CYCLES"],
+        ["cycles.samples", props.bake_samples],
+    ]
+
     # blender 3.0
     if utils.check_blender_version("3.0.0"):
-        bpy.context.scene.cycles.preview_samples = props.bake_samples
-        bpy.context.scene.cycles.use_adaptive_sampling = False
-        bpy.context.scene.cycles.use_preview_adaptive_sampling = False
-        bpy.context.scene.cycles.use_denoising = False
-        bpy.context.scene.cycles.use_preview_denoising = False
-        bpy.context.scene.cycles.use_auto_tile = False
-
-    bpy.context.scene.render.use_bake_multires = False
-    bpy.context.scene.render.bake.use_selected_to_active = False
-    bpy.context.scene.render.bake.use_pass_direct = False
-    bpy.context.scene.render.bake.use_pass_indirect = False
+        settings += [
+            ["cycles.preview_samples", props.bake_samples],
+            ["cycles.use_adaptive_sampling", False],
+            ["cycles.use_preview_adaptive_sampling", False],
+            ["cycles.use_denoising", False],
+            ["cycles.use_preview_denoising", False],
+            ["cycles.use_auto_tile", False],
+        ]
+
+    settings += [
+        ["render.use_bake_multires", False],
+        ["render.bake.use_selected_to_active", False],
+        ["render.bake.use_pass_direct", False],
+        ["render.bake.use_pass_indirect", False],
+        ["render.bake.target", "IMAGE_TEXTURES"],
+        ["render.bake.margin", 1],
+        ["render.bake.use_clear", True],
+        ["render.image_settings.file_format", get_image_format()[0]],
+        ["render.image_settings.quality", props.jpeg_quality],
+        ["render.image_settings.compression", props.png_compression],
+        ["view_settings.view_transform", "Standard"],
+        ["view_settings.look", "None"],
+        ["view_settings.gamma", 1],
+        ["view_settings.exposure", 0],
+        ["sequencer_colorspace_settings.name", "Raw"],
+    ]
+
+    return settings
+
+
+def resolve_setting(scene, path):
+    """Returns the (owner, attribute) of the scene setting path, or (None, None) if it doesn't exist."""
+    owner_path, attr = path.rsplit(".", 1)
+    owner = scene
     try:
-        bpy.context.scene.cycles.samples = props.bake_samples
-        bpy.context.scene.render.bake.target = 'IMAGE_TEXTURES'
+        for name in owner_path.split("."):
+            owner = getattr(owner, name)
     except:
-        pass
-    bpy.context.scene.render.bake.margin = 1
-    bpy.context.scene.render.bake.use_clear = True
-    bpy.context.scene.render.image_settings.file_format = get_image_format()[0]
-    bpy.context.scene.render.image_settings.quality = props.jpeg_quality
-    bpy.context.scene.render.image_settings.compression = props.png_compression
-
-    bpy.context.scene.view_settings.view_transform = 'Standard' #'Raw'
-    bpy.context.scene.view_settings.look = 'None'
-    bpy.context.scene.view_settings.gamma = 1
-    bpy.context.scene.view_settings.exposure = 0
-    bpy.context.scene.sequencer_colorspace_settings.name = 'Raw'
-
-def post_bake():
-    global old_samples, old_file_format, old_quality, old_compression
-    global old_view_transform, old_look, old_gamma, old_exposure, old_colorspace
+        return None, None
+    if not hasattr(owner, attr):
+        return None, None
+    return owner, attr
 
-    try:
-        bpy.context.scene.cycles.samples = old_samples
-    except:
-        pass
 
-    bpy.context.scene.render.image_settings.file_format = old_file_format
-    bpy.context.scene.render.image_settings.quality = old_quality
-    bpy.context.scene.render.image_settings.compression = old_compression
+class BakeSession:
+    """The scene render settings for a whole bake run.
+
+    Entering the session snapshots the scene settings it changes and applies the bake settings once,
+    leaving it restores the snapshot, even if the bake raised.
+    Each session keeps its own snapshot, so nested sessions restore in the right order.
+    """
+
+    def __init__(self, scene):
+        self.scene = scene
+        self.snapshot = []
+
+    def __enter__(self):
+        self.snapshot = []
+        with profiler.span("prep"):
+            for path, value in get_bake_settings():
+                owner, attr = resolve_setting(self.scene, path)
+                if owner is None:
+                    continue
+                try:
+                    old_value = getattr(owner, attr)
+                    setattr(owner, attr, value)
+                    self.snapshot.append([path, owner, attr, old_value])
+                except:
+                    utils.log_info("Unable to set bake setting: " + path)
+        return self
 
-    bpy.context.scene.view_settings.view_transform = old_view_transform
-    bpy.context.scene.view_settings.look = old_look
-    bpy.context.scene.view_settings.gamma = old_gamma
-    bpy.context.scene.view_settings.exposure = old_exposure
-    bpy.context.scene.sequencer_colorspace_settings.name = old_colorspace
+    def __exit__(self, exc_type, exc_value, traceback):
+        # restore in the order applied, i.e. the view transform before the look
+        for path, owner, attr, old_value in self.snapshot:
+            try:
+                setattr(owner, attr, old_value)
+            except:
+                utils.log_info("Unable to restore bake setting: " + path)
+        self.snapshot = []
+        return False
 
 
 
@@ -254,12 +491,14 @@ def bake_target(source_mat, mat, source_node, source_socket, map_suffix, data):
     props = bpy.context.scene.CC3BakeProps
     nodes = mat.node_tree.nodes
     links = mat.node_tree.links
+    node_index = nodeutils.get_node_index(nodes)
 
     target_suffix = get_target_map_suffix(map_suffix)
-    output_node = nodeutils.find_node_by_type(nodes, "OUTPUT_MATERIAL")
+    output_node = nodeutils.find_node_by_type(node_index, "OUTPUT_MATERIAL")
     mat_name = utils.strip_name(mat.name)
-    target_size = get_target_map_size(source_mat, map_suffix)
-    source_size = detect_size_from_suffix(source_mat, map_suffix)
+    with profiler.span("size detection"):
+        target_size = get_target_map_size(source_mat, map_suffix)
+        source_size = detect_size_from_suffix(source_mat, map_suffix)
 
     if props.scale_maps and target_size < source_size:
         utils.log_info("Baking source size: " + str(source_size))
@@ -267,70 +506,461 @@ def bake_target(source_mat, mat, source_node, source_socket, map_suffix, data):
     else:
         size = target_size
 
-    image = make_image_target(nodes, mat_name + "_" + target_suffix, size, data)
+    bake_key = None
+    if props.use_bake_cache:
+        bake_key = get_bake_key(source_node, source_socket, "COMBINED", size, target_size, data)
+        image = get_cached_bake(mat_name + "_" + target_suffix, bake_key, data)
+        if image:
+            image_node = nodeutils.make_image_node(nodes, image)
+            image_node.name = vars.BAKE_PREFIX + mat_name + "_" + map_suffix
+            return image_node
+
+    with profiler.span("image target", size=size):
+        image = make_image_target(nodes, mat_name + "_" + target_suffix, size, data)
     image_node = nodeutils.make_image_node(nodes, image)
     image_node.name = vars.BAKE_PREFIX + mat_name + "_" + map_suffix
 
-    bpy.context.scene.cycles.samples = props.bake_samples
-    utils.log_info("Baking: " + source_node.name + " / " + source_socket + " suffix " + target_suffix)
+    # reuse the bake of the same source made for another target
+    raw_key = get_raw_map_key(source_node, source_socket, "COMBINED", data)
+    if use_raw_map(raw_key, image):
+        finish_bake_target(image_node, map_suffix, target_size, bake_key)
+        return image_node
+
+    samples = get_socket_samples(source_node, source_socket, size)
 
-    prep_bake(size, size)
+    if can_batch_bake(source_node, source_socket, data):
+        utils.log_info("Batching: " + source_node.name + " / " + source_socket + " suffix " + target_suffix)
+        pending_bakes.append([image_node, source_node, source_socket, size, target_size, bake_key, raw_key, samples,
+                              map_suffix])
+        return image_node
+
+    utils.log_info("Baking: " + source_node.name + " / " + source_socket + " suffix " + target_suffix)
 
     nodeutils.link_nodes(links, source_node, source_socket, output_node, "Surface")
     image_node.select = True
     nodes.active = image_node
-    bpy.ops.object.bake(type='COMBINED')
+    cycles_bake("COMBINED", image, samples)
 
-    if props.scale_maps and target_size < source_size:
+    finish_bake_target(image_node, map_suffix, target_size, bake_key, raw_key)
+
+    return image_node
+
+
+def finish_bake_target(image_node, map_suffix, target_size, bake_key, raw_key = None):
+    """Scales the freshly baked image of the image node to the target size and saves it."""
+    image = image_node.image
+
+    store_raw_map(raw_key, image)
+
+    if image.size[0] != target_size or image.size[1] != target_size:
         utils.log_info("Scaling to target size: " + str(target_size))
-        image.scale(target_size, target_size)
+        with profiler.span("scale", size=target_size):
+            image.scale(target_size, target_size)
+
+    # don't save duplicates of an identical bake for another material
+    with profiler.span("dedup"):
+        canonical = dedup.get_canonical_image(image, map_suffix)
+    if canonical:
+        image_node.image = canonical
+        remove_image(image)
+        return
 
-    image.save_render(filepath = image.filepath, scene = bpy.context.scene)
-    image.reload()
+    queue_image_write(image, bake_key)
+    with profiler.span("constant map"):
+        process_constant_map(image)
 
-    post_bake()
 
-    return image_node
+# [image_node, source_node, source_socket, size, target_size, bake_key, raw_key, samples, map_suffix] of the scalar sockets
+# waiting to be baked together by flush_batch_bakes()
+pending_bakes = []
+
+def can_batch_bake(source_node, source_socket, data):
+    """Only scalar sockets baked to data maps can share a bake, one to each of the R, G and B channels."""
+    props = bpy.context.scene.CC3BakeProps
+    if not props.batch_bakes or not data:
+        return False
+    try:
+        return source_node.outputs[source_socket].type == "VALUE"
+    except:
+        return False
+
+
+def make_combine_rgb_node(nodes):
+    if utils.check_blender_version("3.3.0"):
+        return nodeutils.make_shader_node(nodes, "ShaderNodeCombineColor")
+    return nodeutils.make_shader_node(nodes, "ShaderNodeCombineRGB")
+
+
+def flush_batch_bakes(mat):
+    """Bakes the batched scalar sockets of the material, up to three sockets per bake.
+
+    The sockets are combined into the R, G and B of a single emission bake and then split
+    back out into their own maps, so each map is the same as if it was baked on its own.
+    """
+    if not pending_bakes:
+        return
+
+    nodes = mat.node_tree.nodes
+    links = mat.node_tree.links
+    node_index = nodeutils.get_node_index(nodes)
+    output_node = nodeutils.find_node_by_type(node_index, "OUTPUT_MATERIAL")
+
+    # only sockets baked at the same size and samples can share a bake
+    batches = {}
+    for bake in pending_bakes:
+        batches.setdefault((bake[3], bake[7]), []).append(bake)
+    pending_bakes.clear()
+
+    for (size, samples), batch in batches.items():
+        for start in range(0, len(batch), 3):
+            bake_batch(nodes, links, output_node, size, samples, batch[start:start + 3])
+
+
+def bake_batch(nodes, links, output_node, size, samples, batch):
+    start = time.perf_counter()
+
+    if len(batch) == 1:
+        image_node, source_node, source_socket = batch[0][:3]
+        utils.log_info("Baking: " + source_node.name + " / " + source_socket)
+        nodeutils.link_nodes(links, source_node, source_socket, output_node, "Surface")
+        image_node.select = True
+        nodes.active = image_node
+        cycles_bake("COMBINED", image_node.image, samples)
+
+    else:
+        utils.log_info("Baking batch: " + ", ".join([b[1].name + " / " + b[2] for b in batch]))
+        combine_node = make_combine_rgb_node(nodes)
+        for i in range(0, len(batch)):
+            nodeutils.link_nodes(links, batch[i][1], batch[i][2], combine_node, i)
+        nodeutils.link_nodes(links, combine_node, 0, output_node, "Surface")
+        batch_image = bpy.data.images.new(vars.BAKE_PREFIX + "Batch", size, size, alpha=False,
+                                          float_buffer=True, is_data=True)
+        batch_node = nodeutils.make_image_node(nodes, batch_image)
+        batch_node.select = True
+        nodes.active = batch_node
+        cycles_bake("COMBINED", batch_image, samples, batch=len(batch))
+
+        with profiler.span("split", size=size):
+            batch_data = packer.get_image_pixels(batch_image)
+            for i in range(0, len(batch)):
+                image = batch[i][0].image
+                packer.set_image_pixels(image, packer.split_channel(batch_data, batch_image.channels, i, image.channels))
+
+        nodeutils.remove_node(nodes, batch_node)
+        nodeutils.remove_node(nodes, combine_node)
+        bpy.data.images.remove(batch_image)
+
+    for bake in batch:
+        finish_bake_target(bake[0], bake[8], bake[4], bake[5], bake[6])
+
+    # share the time of the batch between its maps
+    seconds = (time.perf_counter() - start) / len(batch)
+    for bake in batch:
+        add_map_timing(bake[0], seconds)
+
+
+def get_bake_key(node, socket, bake_type, size, target_size, data):
+    props = bpy.context.scene.CC3BakeProps
+    settings = [bake_type, size, target_size, data, props.bake_samples, props.target_mode,
+                props.target_format, props.jpeg_quality, props.png_compression,
+                props.scale_maps, props.constant_maps, props.adaptive_samples, props.check_convergence]
+    return bakecache.get_bake_key(node, socket, settings)
+
+
+def get_socket_samples(node, socket, size):
+    """Returns the fewest samples that bake the output socket of the node the same as the full bake samples.
+
+    Image textures read at no more than their own resolution, and any math on them, are the
+    same all over a pixel and converge in a single sample. Procedural and ray traced nodes,
+    hard steps and tiled or larger textures vary within a pixel and get the full bake samples.
+    With no node, only the geometry is baked, which also converges in a single sample.
+    """
+    props = bpy.context.scene.CC3BakeProps
+    if not props.adaptive_samples:
+        return props.bake_samples
+    if node is not None and needs_sampling(node, get_output_identifier(node, socket), size, set()):
+        return props.bake_samples
+    return 1
+
+
+def get_output_identifier(node, socket):
+    """Returns the identifier of the output socket by name or index, or None for all of the outputs."""
+    try:
+        return node.outputs[socket].identifier
+    except:
+        return None
+
+
+def get_group_output_node(tree):
+    output_node = None
+    for node in tree.nodes:
+        if node.type == "GROUP_OUTPUT":
+            if node.is_active_output:
+                return node
+            if output_node is None:
+                output_node = node
+    return output_node
+
+
+def get_group_node_input(group_node, identifier):
+    for socket in group_node.inputs:
+        if socket.identifier == identifier:
+            return socket
+    return None
+
+
+def needs_sampling(node, socket, size, done, groups = ()):
+    """Returns True if the output socket of the node (None for any output) varies within a pixel.
+
+    Follows the links upstream of just that output: into a node group from its group output socket,
+    and back out of it from a group input to the links of the group node's input.
+    groups: the group nodes entered, outermost first.
+    """
+    key = (node.as_pointer(), socket, tuple([group.as_pointer() for group in groups]))
+    if key in done:
+        return False
+    done.add(key)
+
+    if node.type == "GROUP_INPUT":
+        if not groups:
+            return False
+        group_input = get_group_node_input(groups[-1], socket)
+        return group_input is not None and input_needs_sampling(group_input, size, done, groups[:-1])
+
+    if node.type == "GROUP":
+        output_node = get_group_output_node(node.node_tree) if node.node_tree else None
+        if output_node is None:
+            return False
+        for group_output in output_node.inputs:
+            if socket is None or group_output.identifier == socket:
+                if input_needs_sampling(group_output, size, done, groups + (node,)):
+                    return True
+        return False
+
+    if node.type in vars.SAMPLED_NODE_TYPES:
+        return True
+    if node.type == "MATH" and node.operation in vars.SAMPLED_MATH_OPERATIONS:
+        return True
+    if node.type == "VALTORGB" and node.color_ramp.interpolation == "CONSTANT":
+        return True
+    if node.type == "TEX_IMAGE":
+        if node.image and (node.image.size[0] > size or node.image.size[1] > size):
+            return True
+        if not is_uv_vector(node.inputs["Vector"], groups):
+            return True
+
+    for input in node.inputs:
+        if input_needs_sampling(input, size, done, groups):
+            return True
+    return False
+
+
+def input_needs_sampling(input, size, done, groups):
+    for link in input.links:
+        if not link.is_muted and needs_sampling(link.from_node, link.from_socket.identifier, size, done, groups):
+            return True
+    return False
+
+
+def is_uv_vector(input, groups):
+    """Returns True if the texture vector input reads the texture coordinates as they are,
+    through any reroutes and group inputs. Unlinked, it is the UV, or the constant default of a group input."""
+    for link in input.links:
+        node = link.from_node
+        if node.type in vars.UV_NODE_TYPES:
+            return True
+        if node.type == "REROUTE":
+            return is_uv_vector(node.inputs[0], groups)
+        if node.type == "GROUP_INPUT" and groups:
+            group_input = get_group_node_input(groups[-1], link.from_socket.identifier)
+            return group_input is None or is_uv_vector(group_input, groups[:-1])
+        return False
+    return True
+
+
+def set_bake_samples(samples):
+    try:
+        bpy.context.scene.cycles.samples = samples
+    except:
+        pass
+
+
+def cycles_bake(bake_type, image, samples, **args):
+    """Bakes into the active image node with the samples, then puts back the full bake samples.
+
+    With the convergence check, a bake with fewer than the full samples is baked again with twice
+    the samples, and if the two differ by more than half an 8 bit step, with the full samples.
+    """
+    props = bpy.context.scene.CC3BakeProps
+    size = image.size[0]
+    try:
+        if samples < props.bake_samples:
+            utils.log_info("Baking with samples: " + str(samples))
+        set_bake_samples(samples)
+        with profiler.span("cycles bake", size=size, samples=samples, **args):
+            bpy.ops.object.bake(type=bake_type)
+
+        if samples < props.bake_samples and props.check_convergence:
+            first = packer.get_image_pixels(image)
+            samples = min(samples * 2, props.bake_samples)
+            set_bake_samples(samples)
+            with profiler.span("convergence bake", size=size, samples=samples, **args):
+                bpy.ops.object.bake(type=bake_type)
+            converged = packer.is_converged(first, packer.get_image_pixels(image), vars.CONVERGENCE_TOLERANCE)
+            if not converged and samples < props.bake_samples:
+                utils.log_info("Not converged, baking with full samples: " + str(props.bake_samples))
+                samples = props.bake_samples
+                set_bake_samples(samples)
+                with profiler.span("cycles bake", size=size, samples=samples, **args):
+                    bpy.ops.object.bake(type=bake_type)
+    finally:
+        set_bake_samples(props.bake_samples)
+    return samples
+
+
+# raw bake key: [width, height, channels, float32 pixels] of the bake, before it was scaled or saved
+# for the target, kept across the target passes of a multi-target bake.
+# All of them stay in memory for the whole bake, up to vars.RAW_MAP_MEMORY_LIMIT bytes,
+# any more bakes are baked again for each target.
+raw_maps = {}
+raw_map_bytes = 0
+use_raw_maps = False
+
+def clear_raw_maps():
+    global raw_map_bytes
+    raw_maps.clear()
+    raw_map_bytes = 0
+
+
+def get_raw_map_key(node, socket, bake_type, data):
+    """Returns the content key of the bake, independent of the target, or None if not keeping raw bakes."""
+    props = bpy.context.scene.CC3BakeProps
+    if not use_raw_maps:
+        return None
+    return bakecache.get_bake_key(node, socket, [bake_type, data, props.bake_samples,
+                                                 props.adaptive_samples, props.check_convergence])
+
+
+def use_raw_map(raw_key, image):
+    """Fills the image from the raw bake, if it has been baked for another target at least as large."""
+    raw_map = raw_maps.get(raw_key) if raw_key else None
+    if raw_map is None:
+        return False
+    width, height, channels, data = raw_map
+    if width < image.size[0] or height < image.size[1] or channels != image.channels:
+        return False
+    utils.log_info("Reusing raw bake for: " + image.name)
+    if width != image.size[0] or height != image.size[1]:
+        data = packer.get_scaled_pixels(data, width, height, channels, image.size[0])
+    packer.set_image_pixels(image, data)
+    return True
+
+
+def store_raw_map(raw_key, image):
+    """Keeps a copy of the freshly baked pixels of the image, read from its buffer as it is only in memory."""
+    global raw_map_bytes
+    if raw_key:
+        raw_map = raw_maps.get(raw_key)
+        if raw_map and raw_map[0] >= image.size[0]:
+            return
+        data = packer.get_image_pixels(image)
+        freed = raw_map[3].nbytes if raw_map else 0
+        if raw_map_bytes - freed + data.nbytes > vars.RAW_MAP_MEMORY_LIMIT:
+            utils.log_info("Raw bake memory limit reached, not keeping: " + image.name)
+            return
+        raw_map_bytes += data.nbytes - freed
+        raw_maps[raw_key] = [image.size[0], image.size[1], image.channels, data]
+
+
+def get_cached_bake(name, bake_key, data):
+    """Returns the image from the bake folder if it was baked from identical content and settings, otherwise None."""
+    format, ext = get_image_format()
+    path = get_bake_path()
+    filepath = os.path.join(path, name + ext)
+
+    if not bakecache.is_cached(path, filepath, bake_key):
+        return None
+
+    utils.log_info("Using cached bake: " + name)
+    image = get_registered_image(name)
+    if image and image.filepath and is_same_path(image.filepath, filepath):
+        image.reload()
+    else:
+        image = bpy.data.images.load(filepath)
+        image.name = name
+        if data:
+            image.colorspace_settings.is_data = True
+        register_image(image)
+    image_io["decode"] += 1
+    process_constant_map(image)
+    return image
+
+
+def store_cached_bake(image, bake_key):
+    if bake_key:
+        bakecache.store(get_bake_path(), bpy.path.abspath(image.filepath), bake_key)
 
 
 def bake_shader_normal(source_mat, mat):
+    start = time.perf_counter()
+    with profiler.span("Normal", "map", material=mat.name, map="Normal"):
+        image_node = bake_shader_normal_target(source_mat, mat)
+    record_map_timing(mat, "Normal", image_node, start)
+    return image_node
+
+
+def bake_shader_normal_target(source_mat, mat):
     props = bpy.context.scene.CC3BakeProps
 
     nodes = mat.node_tree.nodes
     links = mat.node_tree.links
+    node_index = nodeutils.get_node_index(nodes)
 
     target_suffix = get_target_map_suffix("Normal")
-    shader_node = nodeutils.get_shader_node(nodes)
-    bsdf_node = nodeutils.get_bsdf_node(nodes)
-    output_node = nodeutils.find_node_by_type(nodes, "OUTPUT_MATERIAL")
+    shader_node = nodeutils.get_shader_node(node_index)
+    bsdf_node = nodeutils.get_bsdf_node(node_index)
+    output_node = nodeutils.find_node_by_type(node_index, "OUTPUT_MATERIAL")
     mat_name = utils.strip_name(mat.name)
 
-    target_size = get_target_map_size(source_mat, "Normal")
-    source_size = detect_size_from_suffix(source_mat, "Normal")
+    with profiler.span("size detection"):
+        target_size = get_target_map_size(source_mat, "Normal")
+        source_size = detect_size_from_suffix(source_mat, "Normal")
 
     if props.scale_maps and target_size < source_size:
         size = source_size
     else:
         size = target_size
 
-    image = make_image_target(nodes, mat_name + "_" + target_suffix, size, True)
+    bake_key = None
+    if props.use_bake_cache:
+        bake_key = get_bake_key(bsdf_node, "Normal", "NORMAL", size, target_size, True)
+        image = get_cached_bake(mat_name + "_" + target_suffix, bake_key, True)
+        if image:
+            image_node = nodeutils.make_image_node(nodes, image)
+            image_node.name = vars.BAKE_PREFIX + mat_name + "_Normal"
+            return image_node
+
+    with profiler.span("image target", size=size):
+        image = make_image_target(nodes, mat_name + "_" + target_suffix, size, True)
     image_node = nodeutils.make_image_node(nodes, image)
     image_node.name = vars.BAKE_PREFIX + mat_name + "_Normal"
 
-    prep_bake(size, size)
-
-    nodeutils.link_nodes(links, bsdf_node, "BSDF", output_node, "Surface")
-    image_node.select = True
-    nodes.active = image_node
-    bpy.ops.object.bake(type='NORMAL')
-
-    if props.scale_maps and target_size < source_size:
-        image.scale(target_size, target_size)
+    # reuse the bake of the same normals made for another target
+    raw_key = get_raw_map_key(bsdf_node, "Normal", "NORMAL", True)
+    if not use_raw_map(raw_key, image):
+        normal_node = nodeutils.get_node_connected_to_input(bsdf_node, "Normal")
+        samples = get_socket_samples(normal_node, nodeutils.get_socket_connected_to_input(bsdf_node, "Normal"), size)
+        nodeutils.link_nodes(links, bsdf_node, "BSDF", output_node, "Surface")
+        image_node.select = True
+        nodes.active = image_node
+        cycles_bake("NORMAL", image, samples)
+        store_raw_map(raw_key, image)
 
-    image.save_render(filepath = image.filepath, scene = bpy.context.scene)
-    image.reload()
+    if image.size[0] != target_size or image.size[1] != target_size:
+        with profiler.span("scale", size=target_size):
+            image.scale(target_size, target_size)
 
-    post_bake()
+    queue_image_write(image, bake_key)
 
     return image_node
 
@@ -343,14 +973,50 @@ def bake_socket_input(source_mat, mat, to_node, to_socket, suffix, data = True):
 
 def bake_socket_output(source_mat, mat, from_node, from_socket, suffix, data = True):
     if from_node:
-        # Note: Don't copy Alpha inputs as full textures, just Color inputs:
-        if from_node.type == "TEX_IMAGE" and from_socket == "Color":
-            return copy_target(source_mat, mat, from_node, from_socket, suffix, data)
-        else:
-            return bake_target(source_mat, mat, from_node, from_socket, suffix, data)
+        start = time.perf_counter()
+        with profiler.span(suffix, "map", material=mat.name, map=suffix):
+            # Note: Don't copy Alpha inputs as full textures, just Color inputs:
+            if from_node.type == "TEX_IMAGE" and from_socket == "Color":
+                image_node = copy_target(source_mat, mat, from_node, from_socket, suffix, data)
+            else:
+                image_node = bake_target(source_mat, mat, from_node, from_socket, suffix, data)
+        record_map_timing(mat, suffix, image_node, start)
+        return image_node
     return from_node
 
 
+# the timings of each map made in the bake run: [{ "target", "material", "map", "image", "seconds" }]
+map_timings = []
+# image node pointer: map timing, to add the time of the deferred batch bakes to
+map_timing_nodes = {}
+
+def clear_map_timings():
+    map_timings.clear()
+    map_timing_nodes.clear()
+
+
+def record_map_timing(mat, map_suffix, image_node, start):
+    if image_node is None:
+        return
+    props = bpy.context.scene.CC3BakeProps
+    timing = {
+        "target": props.target_mode,
+        "material": mat.name,
+        "map": map_suffix,
+        "image": image_node.image.name if image_node.image else "",
+        "seconds": time.perf_counter() - start,
+    }
+    map_timings.append(timing)
+    map_timing_nodes[image_node.as_pointer()] = timing
+
+
+def add_map_timing(image_node, seconds):
+    timing = map_timing_nodes.get(image_node.as_pointer())
+    if timing:
+        timing["seconds"] += seconds
+        timing["image"] = image_node.image.name if image_node.image else ""
+
+
 def position(node, loc):
     if node:
         node.location = loc
@@ -360,8 +1026,9 @@ def prep_diffuse(mat, shader_node):
     props = bpy.context.scene.CC3BakeProps
     nodes = mat.node_tree.nodes
     links = mat.node_tree.links
+    node_index = nodeutils.get_node_index(nodes)
     # turn off depth for cornea parallax
-    parallax_tiling_node = nodeutils.find_node_by_keywords(nodes, nodeutils.NODE_PREFIX, "(tiling_rl_cornea_shader_DIFFUSE_mapping)")
+    parallax_tiling_node = nodeutils.find_node_by_keywords(node_index, nodeutils.NODE_PREFIX, "(tiling_rl_cornea_shader_DIFFUSE_mapping)")
     if parallax_tiling_node:
         nodeutils.set_node_input(parallax_tiling_node, "Depth", 0.0)
     # for baking separate diffuse and AO, set the amount of AO to bake into the diffuse map
@@ -407,8 +1074,9 @@ def bake_material(obj, mat, source_mat):
     props = bpy.context.scene.CC3BakeProps
     nodes = mat.node_tree.nodes
     links = mat.node_tree.links
-    shader_node : bpy.types.Node = nodeutils.get_shader_node(nodes)
-    bsdf_node = nodeutils.get_bsdf_node(nodes)
+    node_index = nodeutils.get_node_index(nodes)
+    shader_node : bpy.types.Node = nodeutils.get_shader_node(node_index)
+    bsdf_node = nodeutils.get_bsdf_node(node_index)
     bake_maps = vars.get_bake_target_maps(props.target_mode)
 
     utils.log_info("Baking for " + props.target_mode + ": " + obj.name + " / " + mat.name)
@@ -430,11 +1098,13 @@ def bake_material(obj, mat, source_mat):
                 if "AO" in shader_node.outputs:
                     ao_bake_node = bake_socket_output(source_mat, mat, shader_node, "AO", "AO")
                 else:
-                    ao_node = nodeutils.find_shader_texture(nodes, "AO")
+                    ao_node = nodeutils.find_shader_texture(node_index, "AO")
                     if ao_node:
                         ao_bake_node = bake_socket_output(source_mat, mat, ao_node, "Color", "AO")
             if "Diffuse" in bake_maps:
                 # if there is a "Diffuse" output node, bake that, otherwise bake the "Base Color" output node.
+                # (anything batched so far must be baked before the diffuse prep changes the shader)
+                flush_batch_bakes(mat)
                 prep_diffuse(mat, shader_node)
                 if "Diffuse" in shader_node.outputs:
                     diffuse_bake_node = bake_socket_output(source_mat, mat, shader_node, "Diffuse", "Diffuse", False)
@@ -460,7 +1130,7 @@ def bake_material(obj, mat, source_mat):
     thickness_bake_node = None
     if "Thickness" in bake_maps:
         utils.log_info("Processing Thickness/Transmission")
-        thickness_node = nodeutils.find_shader_texture(nodes, "TRANSMISSION")
+        thickness_node = nodeutils.find_shader_texture(node_index, "TRANSMISSION")
         if thickness_node:
             utils.log_info("thickness texture found...")
             thickness_bake_node = bake_socket_output(source_mat, mat, thickness_node, "Color", "Thickness")
@@ -506,7 +1176,7 @@ def bake_material(obj, mat, source_mat):
     if nodeutils.is_connected(bsdf_node, "Emission"):
         if "Emission" in bake_maps:
             utils.log_info("Processing Emission")
-            emission_node = nodeutils.find_shader_texture(nodes, "EMISSION")
+            emission_node = nodeutils.find_shader_texture(node_index, "EMISSION")
             if emission_node:
                 if can_bake_shader_node(shader_node, bsdf_node, "Emission"):
                     emission_bake_node = bake_socket_output(source_mat, mat, emission_node, "Color", "Emission")
@@ -546,7 +1216,7 @@ def bake_material(obj, mat, source_mat):
     if nodeutils.is_connected(bsdf_node, "Normal"):
         if "Bump" in bake_maps and props.allow_bump_maps:
             if can_bake_shader_node(shader_node, bsdf_node, "Normal"):
-                bump_node = nodeutils.find_shader_texture(nodes, "BUMP")
+                bump_node = nodeutils.find_shader_texture(node_index, "BUMP")
                 bump_distance = nodeutils.get_node_input(shader_node, "Bump Strength", 0.01)
                 if bump_node:
                     bump_bake_node = bake_socket_output(source_mat, mat, bump_node, "Color", "Bump")
@@ -575,7 +1245,7 @@ def bake_material(obj, mat, source_mat):
                     normal_strength = 1.0
                     normal_bake_node = bake_socket_output(source_mat, mat, shader_node, "Blend Normal", "Normal")
                 else:
-                    normal_node = nodeutils.find_shader_texture(nodes, "NORMAL")
+                    normal_node = nodeutils.find_shader_texture(node_index, "NORMAL")
                     if normal_node:
                         normal_bake_node = bake_socket_output(source_mat, mat, normal_node, "Color", "Normal")
                     else:
@@ -612,7 +1282,7 @@ def bake_material(obj, mat, source_mat):
     micro_normal_scale = mathutils.Vector((1, 1, 1))
     if nodeutils.is_connected(bsdf_node, "Normal"):
         if "MicroNormal" in bake_maps:
-            micro_normal_node = nodeutils.find_shader_texture(nodes, "MICRONORMAL")
+            micro_normal_node = nodeutils.find_shader_texture(node_index, "MICRONORMAL")
             if micro_normal_node:
                 tiling_node = nodeutils.get_node_connected_to_input(micro_normal_node, "Vector")
                 if tiling_node:
@@ -626,6 +1296,7 @@ def bake_material(obj, mat, source_mat):
                         micro_normal_scale = mathutils.Vector((micro_normal_tiling, micro_normal_tiling, 1))
                 utils.log_info(f"Tiling: {micro_normal_scale}")
                 # disconnect any tiling/mapping nodes before baking the micro normal...
+                flush_batch_bakes(mat)
                 nodeutils.unlink_node(links, micro_normal_node, "Vector")
                 micro_normal_bake_node = bake_socket_output(source_mat, mat, micro_normal_node, "Color", "MicroNormal")
 
@@ -641,16 +1312,36 @@ def bake_material(obj, mat, source_mat):
                     micro_normal_mask_bake_node = bake_socket_output(source_mat, mat, shader_node, "Normal Mask", "MicroNormalMask")
                     micro_normal_strength = 1.0
                 else:
-                    micro_normal_mask_node = nodeutils.find_shader_texture(nodes, "MICRONMASK")
+                    micro_normal_mask_node = nodeutils.find_shader_texture(node_index, "MICRONMASK")
                     micro_normal_strength = nodeutils.get_node_input(shader_node, "Micro Normal Strength", 1.0)
                     if micro_normal_mask_node:
                         micro_normal_mask_bake_node = bake_socket_output(source_mat, mat, micro_normal_mask_node, "Color", "MicroNormalMask")
 
+    # bake anything still batched
+    flush_batch_bakes(mat)
+
     # Post processing
     #
     utils.log_info("Post Processing Textures...")
     utils.log_info("")
 
+    bake_nodes = {
+        "Diffuse": diffuse_bake_node,
+        "AO": ao_bake_node,
+        "Subsurface": sss_bake_node,
+        "Thickness": thickness_bake_node,
+        "Metallic": metallic_bake_node,
+        "Specular": specular_bake_node,
+        "Roughness": roughnesss_bake_node,
+        "Emission": emission_bake_node,
+        "Alpha": alpha_bake_node,
+        "Transmission": transmission_bake_node,
+        "Bump": bump_bake_node,
+        "Normal": normal_bake_node,
+        "MicroNormal": micro_normal_bake_node,
+        "MicroNormalMask": micro_normal_mask_bake_node,
+    }
+
     if props.target_mode == "BLENDER":
         pass
 
@@ -663,31 +1354,19 @@ def bake_material(obj, mat, source_mat):
     elif props.target_mode == "GLTF":
         if props.pack_gltf:
             # BaseMap: RGB: diffuse, A: alpha
-            combine_diffuse_tex(nodes, source_mat, mat,
-                    diffuse_bake_node, alpha_bake_node)
             # GLTF pack: R: Ao, G: Roughness, B: Metallic
-            combine_gltf(nodes, source_mat, mat, ao_bake_node, roughnesss_bake_node, metallic_bake_node)
+            combine_target_packs(nodes, source_mat, mat, bake_nodes)
 
     elif props.target_mode == "UNITY_URP":
         # BaseMap: RGB: diffuse, A: alpha
-        combine_diffuse_tex(nodes, source_mat, mat,
-                diffuse_bake_node, alpha_bake_node)
-
         # MetallicAlpha: RGB: Metallic, A: Smoothness = f(Rougness)
-        make_metallic_smoothness_tex(nodes, source_mat, mat, metallic_bake_node, roughnesss_bake_node)
+        combine_target_packs(nodes, source_mat, mat, bake_nodes)
 
     elif props.target_mode == "UNITY_HDRP":
         # BaseMap: RGB: diffuse, A: alpha
-        combine_diffuse_tex(nodes, source_mat, mat,
-                diffuse_bake_node, alpha_bake_node)
-
         # Mask: R: Metallic, G: AO, B: Micro-Normal Mask, A: Smoothness = f(Roughness)
-        combine_hdrp_mask_tex(nodes, source_mat, mat,
-                metallic_bake_node, ao_bake_node, micro_normal_mask_bake_node, roughnesss_bake_node)
-
         # Detail: R: 0.5, G: Micro-Normal.R, B: 0.5, A: Micro-Normal.G
-        combine_hdrp_detail_tex(nodes, source_mat, mat,
-                micro_normal_bake_node)
+        combine_target_packs(nodes, source_mat, mat, bake_nodes)
 
         # invert the thickness map
         process_hdrp_subsurfaces_tex(sss_bake_node, thickness_bake_node)
@@ -697,334 +1376,105 @@ def bake_material(obj, mat, source_mat):
     utils.log_info("Reconnecting baked material:")
     utils.log_info("")
 
-    reconnect_material(mat, ao_strength, sss_radius, bump_distance, normal_strength, micro_normal_strength, micro_normal_scale)
-
-
-def combine_diffuse_tex(nodes, source_mat, mat, diffuse_node, alpha_node):
-    diffuse_data = None
-    alpha_data = None
-    bsdf_node = nodeutils.get_bsdf_node(nodes)
-    diffuse_value = nodeutils.get_node_input(bsdf_node, "Base Color", (1,1,1,1))
-    # image.pixels object fetches the entire array anew every call and is extremely slow to use
-    # directly so, for speed, make a copy of it into a tuple or a list and work on that.
-    if diffuse_node:
-        # read-only tuple copy for fastest read speed
-        diffuse_data = diffuse_node.image.pixels[:]
-
-    if alpha_node:
-        # read-only tuple copy for fastest read speed
-        alpha_data = alpha_node.image.pixels[:]
-
-    if diffuse_node is None and alpha_node is None:
-        return
-
-    utils.log_info("Combining diffuse with alpha...")
-
-    map_suffix = "BaseMap"
-    target_suffix = get_target_map_suffix(map_suffix)
-    mat_name = utils.strip_name(mat.name)
-    size = get_target_map_size(source_mat, map_suffix)
-    image = make_image_target(nodes, mat_name + "_" + target_suffix, size, False, True)
-    image_node = nodeutils.make_image_node(nodes, image)
-    image_node.name = vars.BAKE_PREFIX + mat_name + "_" + map_suffix
-    image_node.select = True
-    nodes.active = image_node
-    # writeable list copy for fastest write speed
-    image_data = list(image.pixels)
-    l = len(image_data)
-
-    for i in range(0, l, 4):
-        if diffuse_data:
-            image_data[i+0] = diffuse_data[i+0]
-            image_data[i+1] = diffuse_data[i+1]
-            image_data[i+2] = diffuse_data[i+2]
-        else:
-            image_data[i+0] = diffuse_value[0]
-            image_data[i+1] = diffuse_value[1]
-            image_data[i+2] = diffuse_value[2]
+    with profiler.span("reconnect"):
+        reconnect_material(mat, ao_strength, sss_radius, bump_distance, normal_strength, micro_normal_strength, micro_normal_scale)
 
-        if alpha_data:
-            image_data[i+3] = alpha_data[i]
-        else:
-            image_data[i+3] = 1
+    # the material's maps are finished, write them while the next material bakes
+    write_pending_images()
 
-    # replace in-place in one go.
-    image.pixels[:] = image_data
-    image.update()
-    image.save()
 
+pack_jobs = []
+inverted_images = set()
 
-def combine_hdrp_mask_tex(nodes, source_mat, mat, metallic_node, ao_node, mask_node, roughness_node):
+def queue_pack_job(job):
+    """Packs the texture now, or queues it to be packed in parallel after all the materials are baked."""
     props = bpy.context.scene.CC3BakeProps
-
-    metallic_data = None
-    ao_data = None
-    mask_data = None
-    roughness_data = None
-
-    if metallic_node:
-        metallic_data = metallic_node.image.pixels[:]
-    if ao_node:
-        ao_data = ao_node.image.pixels[:]
-    if mask_node:
-        mask_data = mask_node.image.pixels[:]
-    if roughness_node:
-        roughness_data = roughness_node.image.pixels[:]
-
-    if metallic_node is None and ao_node is None and mask_node is None and roughness_node is None:
-        return
-
-    utils.log_info("Combining Unity HDRP Mask Texture...")
-
-    bsdf_node = nodeutils.get_bsdf_node(nodes)
-    metallic_value = nodeutils.get_node_input(bsdf_node, "Metallic", 0.0)
-    roughness_value = nodeutils.get_node_input(bsdf_node, "Roughness", 0.0)
-    ao_value = 1
-    mask_value = 1
-
-    map_suffix = "Mask"
-    target_suffix = get_target_map_suffix(map_suffix)
-    mat_name = utils.strip_name(mat.name)
-    size = get_target_map_size(source_mat, map_suffix)
-    image = make_image_target(nodes, mat_name + "_" + target_suffix, size, True, True)
-    image_node = nodeutils.make_image_node(nodes, image)
-    image_node.name = vars.BAKE_PREFIX + mat_name + "_" + map_suffix
-    image_node.select = True
-    nodes.active = image_node
-    image_data = list(image.pixels)
-    l = len(image_data)
-
-    # Mask: R: Metallic, G: AO, B: Micro-Normal Mask, A: Smoothness = 0.5 + 0.5*(1-Roughess)^2
-    for i in range(0, l, 4):
-
-        # Red
-        if metallic_data:
-            image_data[i] = metallic_data[i]
-        else:
-            image_data[i] = metallic_value
-
-        # Green
-        if ao_data:
-            image_data[i+1] = ao_data[i]
-        else:
-            image_data[i+1] = ao_value
-
-        # Blue
-        if mask_data:
-            image_data[i+2] = mask_data[i]
-        else:
-            image_data[i+2] = mask_value
-
-        # Alpha
-        if roughness_data:
-            roughness = roughness_data[i]
-        else:
-            roughness = roughness_value
-
-        if props.smoothness_mapping == "SIR":
-            smoothness = pow(1 - roughness, 2)
-        elif props.smoothness_mapping == "IRS":
-            smoothness = 1 - pow(roughness, 2)
-        elif props.smoothness_mapping == "IRSR":
-            smoothness = 1 - pow(roughness, 0.5)
-        elif props.smoothness_mapping == "SRIR":
-            smoothness = pow(1 - roughness, 0.5)
-        elif props.smoothness_mapping == "SRIRS":
-            smoothness = pow(1 - pow(roughness, 2), 0.5)
-        else: # IR
-            smoothness = 1 - roughness
-
-        image_data[i+3] = smoothness
-
-    image.pixels[:] = image_data
-    image.update()
-    image.save()
-
-
-def combine_hdrp_detail_tex(nodes, source_mat, mat, detail_normal_node):
-
-    detail_data = None
-    if detail_normal_node:
-        detail_data = detail_normal_node.image.pixels[:]
+    if props.pack_threads > 1:
+        pack_jobs.append(job)
     else:
-        return
-
-    utils.log_info("Combining Unity HDRP Detail Texture...")
-
-    map_suffix = "Detail"
-    target_suffix = get_target_map_suffix(map_suffix)
-    mat_name = utils.strip_name(mat.name)
-    size = get_target_map_size(source_mat, map_suffix)
-    image = make_image_target(nodes, mat_name + "_" + target_suffix, size, True, True)
-    image_node = nodeutils.make_image_node(nodes, image)
-    image_node.name = vars.BAKE_PREFIX + mat_name + "_" + map_suffix
-    image_node.select = True
-    nodes.active = image_node
-    image_data = list(image.pixels)
-    l = len(image_data)
-
-    # Detail: R: 0.5, G: Micro-Normal.R, B: 0.5, A: Micro-Normal.G
-    for i in range(0, l, 4):
-
-        image_data[i+0] = 0.5
-        image_data[i+2] = 0.5
-
-        if detail_data:
-            image_data[i+1] = detail_data[i+0]
-            image_data[i+3] = detail_data[i+1]
-        else:
-            image_data[i+1] = 0.5
-            image_data[i+3] = 0.5
-
-    image.pixels[:] = image_data
-    image.update()
-    image.save()
-
+        with profiler.span("pack", size=job.size):
+            job.run()
+        queue_image_write(job.image)
 
-def process_hdrp_subsurfaces_tex(sss_node, trans_node):
 
-    if trans_node and trans_node.image:
-        image = trans_node.image
-        trans_data = list(image.pixels)
-        l = len(trans_data)
-        for i in range(0, l, 4):
-            trans_data[i+0] = 1.0 - trans_data[i+0]
-            trans_data[i+1] = 1.0 - trans_data[i+1]
-            trans_data[i+2] = 1.0 - trans_data[i+2]
-
-        image.pixels[:] = trans_data
-        image.update()
-        image.save()
+def flush_pack_jobs():
+    props = bpy.context.scene.CC3BakeProps
+    if pack_jobs:
+        with profiler.span("pack", jobs=len(pack_jobs), threads=props.pack_threads):
+            packer.run_pack_jobs(pack_jobs, props.pack_threads)
+        for job in pack_jobs:
+            queue_image_write(job.image)
+        pack_jobs.clear()
+
+
+def get_pack_image(node):
+    """Returns the image of the bake node if it has pixels to pack, or None."""
+    if node and node.image and node.image.size[0] > 0 and node.image.size[1] > 0:
+        return node.image
+    return None
 
 
-def make_metallic_smoothness_tex(nodes, source_mat, mat, metallic_node, roughness_node):
+def combine_packed_tex(nodes, source_mat, mat, map_suffix, bake_nodes):
+    """Packs the baked maps into the packed texture map_suffix as defined in vars.CHANNEL_PACKS"""
     props = bpy.context.scene.CC3BakeProps
+    data, alpha, channel_specs = vars.CHANNEL_PACKS[map_suffix]
 
-    metallic_data = None
-    roughness_data = None
-
-    if metallic_node and metallic_node.image:
-        metallic_data = metallic_node.image.pixels[:]
-    if roughness_node and roughness_node.image:
-        roughness_data = roughness_node.image.pixels[:]
+    source_suffixes = []
+    for spec in channel_specs:
+        if spec and spec[0] and spec[0] not in source_suffixes:
+            source_suffixes.append(spec[0])
 
-    if metallic_node is None and roughness_node is None:
+    # only pack if there is something baked to pack
+    if not [s for s in source_suffixes if bake_nodes.get(s)]:
         return
 
-    utils.log_info("Create Unity URP/3D Metallic Alpha Texture from Metallic and Roughness...")
-
-    bsdf_node = nodeutils.get_bsdf_node(nodes)
-    roughness_value = nodeutils.get_node_input(bsdf_node, "Roughness", 0.5)
-    metallic_value = nodeutils.get_node_input(bsdf_node, "Metallic", 0)
+    utils.log_info("Combining packed texture: " + map_suffix + "...")
 
-    map_suffix = "MetallicAlpha"
+    node_index = nodeutils.get_node_index(nodes)
+    bsdf_node = nodeutils.get_bsdf_node(node_index)
     target_suffix = get_target_map_suffix(map_suffix)
     mat_name = utils.strip_name(mat.name)
     size = get_target_map_size(source_mat, map_suffix)
-    image = make_image_target(nodes, mat_name + "_" + target_suffix, size, True, True)
+    source_images = {}
+    for source_suffix in source_suffixes:
+        source_images[source_suffix] = get_pack_image(bake_nodes.get(source_suffix))
+
+    # if everything packed is constant, so is the packed map
+    if props.constant_maps != "FULL":
+        if not [i for i in source_images.values() if i and not is_constant_map(i)]:
+            utils.log_info("All packed maps are constant, packing tiny texture.")
+            size = vars.CONSTANT_MAP_SIZE
+    with profiler.span("image target", size=size):
+        image = make_image_target(nodes, mat_name + "_" + target_suffix, size, data, alpha)
     image_node = nodeutils.make_image_node(nodes, image)
     image_node.name = vars.BAKE_PREFIX + mat_name + "_" + map_suffix
     image_node.select = True
     nodes.active = image_node
-    image_data = list(image.pixels)
-    l = len(image_data)
 
-    # Mask: R: Metallic, G: AO, B: Micro-Normal Mask, A: Smoothness = 0.5 + 0.5*(1-Roughess)^2
-    for i in range(0, l, 4):
+    queue_pack_job(packer.PackJob(image, channel_specs, source_images, bsdf_node, props.pack_band_rows))
 
-        if roughness_data:
-            roughness = roughness_data[i]
-        else:
-            roughness = roughness_value
 
-        if metallic_data:
-            metallic = metallic_data[i]
-        else:
-            metallic = metallic_value
-
-        if props.smoothness_mapping == "SIR":
-            smoothness = pow(1 - roughness, 2)
-        elif props.smoothness_mapping == "IRS":
-            smoothness = 1 - pow(roughness, 2)
-        elif props.smoothness_mapping == "IRSR":
-            smoothness = 1 - pow(roughness, 0.5)
-        elif props.smoothness_mapping == "SRIR":
-            smoothness = pow(1 - roughness, 0.5)
-        elif props.smoothness_mapping == "SRIRS":
-            smoothness = pow(1 - pow(roughness, 2), 0.5)
-        else: # IR
-            smoothness = 1 - roughness
-
-        image_data[i+0] = metallic
-        image_data[i+1] = metallic
-        image_data[i+2] = metallic
-        image_data[i+3] = smoothness
-
-    image.pixels[:] = image_data
-    image.update()
-    image.save()
-
-
-def combine_gltf(nodes, source_mat, mat, ao_node, roughness_node, metallic_node):
+def combine_target_packs(nodes, source_mat, mat, bake_nodes):
     props = bpy.context.scene.CC3BakeProps
+    for map_suffix in vars.get_bake_target_packs(props.target_mode):
+        combine_packed_tex(nodes, source_mat, mat, map_suffix, bake_nodes)
 
-    metallic_data = None
-    ao_data = None
-    roughness_data = None
-
-    if metallic_node:
-        metallic_data = metallic_node.image.pixels[:]
-    if ao_node:
-        ao_data = ao_node.image.pixels[:]
-    if roughness_node:
-        roughness_data = roughness_node.image.pixels[:]
-
-    if metallic_node is None and ao_node is None and roughness_node is None:
-        return
-
-    utils.log_info("Combining GLTF texture pack...")
-
-    bsdf_node = nodeutils.get_bsdf_node(nodes)
-    metallic_value = nodeutils.get_node_input(bsdf_node, "Metallic", 0.0)
-    roughness_value = nodeutils.get_node_input(bsdf_node, "Roughness", 0.0)
-    ao_value = 1
-
-    map_suffix = "GLTF"
-    target_suffix = get_target_map_suffix(map_suffix)
-    mat_name = utils.strip_name(mat.name)
-    size = get_target_map_size(source_mat, map_suffix)
-    image = make_image_target(nodes, mat_name + "_" + target_suffix, size, True, False)
-    image_node = nodeutils.make_image_node(nodes, image)
-    image_node.name = vars.BAKE_PREFIX + mat_name + "_" + map_suffix
-    image_node.select = True
-    nodes.active = image_node
-    image_data = list(image.pixels)
-    l = len(image_data)
-
-    # GLTF: R: AO, G: Roughness, B: Metallic
-    for i in range(0, l, 4):
 
-        # Red
-        if ao_data:
-            image_data[i+0] = ao_data[i]
-        else:
-            image_data[i+0] = ao_value
-
-        # Green
-        if roughness_data:
-            image_data[i+1] = roughness_data[i]
-        else:
-            image_data[i+1] = roughness_value
-
-        # Blue
-        if metallic_data:
-            image_data[i+2] = metallic_data[i]
-        else:
-            image_data[i+2] = metallic_value
+def process_hdrp_subsurfaces_tex(sss_node, trans_node):
+    props = bpy.context.scene.CC3BakeProps
 
-    image.pixels[:] = image_data
-    image.update()
-    image.save()
+    image = get_pack_image(trans_node)
+    # deduplicated maps may be shared, only invert them once
+    if image and image not in inverted_images:
+        inverted_images.add(image)
+        # invert RGB, keep alpha
+        channel_specs = [
+            ["Thickness", 0, None, 0.0, "INVERT"],
+            ["Thickness", 1, None, 0.0, "INVERT"],
+            ["Thickness", 2, None, 0.0, "INVERT"],
+            None,
+        ]
+        queue_pack_job(packer.PackJob(image, channel_specs, { "Thickness": image }, None, props.pack_band_rows))
 
 
 def reconnect_material(mat, ao_strength, sss_radius, bump_distance, normal_strength, micro_normal_strength, micro_normal_scale):
@@ -1032,9 +1482,10 @@ def reconnect_material(mat, ao_strength, sss_radius, bump_distance, normal_stren
 
     nodes = mat.node_tree.nodes
     links = mat.node_tree.links
-    shader_node = nodeutils.get_shader_node(nodes)
-    bsdf_node = nodeutils.get_bsdf_node(nodes)
-    output_node = nodeutils.find_node_by_type(nodes, "OUTPUT_MATERIAL")
+    node_index = nodeutils.get_node_index(nodes)
+    shader_node = nodeutils.get_shader_node(node_index)
+    bsdf_node = nodeutils.get_bsdf_node(node_index)
+    output_node = nodeutils.find_node_by_type(node_index, "OUTPUT_MATERIAL")
 
     nodeutils.link_nodes(links, bsdf_node, "BSDF", output_node, "Surface")
 
@@ -1165,6 +1616,14 @@ def reconnect_material(mat, ao_strength, sss_radius, bump_distance, normal_stren
         else:
             nodeutils.link_nodes(links, diffuse_node, "Color", bsdf_node, "Subsurface Color")
 
+    if props.constant_maps == "VALUE":
+        metallic_node = fold_constant_map(nodes, metallic_node, bsdf_node, "Metallic")
+        specular_node = fold_constant_map(nodes, specular_node, bsdf_node, "Specular")
+        roughness_node = fold_constant_map(nodes, roughness_node, bsdf_node, "Roughness")
+        emission_node = fold_constant_map(nodes, emission_node, bsdf_node, "Emission")
+        alpha_node = fold_constant_map(nodes, alpha_node, bsdf_node, "Alpha")
+        transmission_node = fold_constant_map(nodes, transmission_node, bsdf_node, "Transmission")
+
     if metallic_node:
         nodeutils.link_nodes(links, metallic_node, "Color", bsdf_node, "Metallic")
     if specular_node:
@@ -1251,6 +1710,20 @@ def reconnect_material(mat, ao_strength, sss_radius, bump_distance, normal_stren
     position(micro_mask_mult_node, (-640,-600))
 
 
+def fold_constant_map(nodes, image_node, bsdf_node, socket):
+    """Replaces a constant image node with the BSDF input value. Returns the image node if it was kept."""
+    if image_node and bsdf_node and is_constant_map(image_node.image) and socket in bsdf_node.inputs:
+        value = image_node.image[vars.CONSTANT_MAP_PROP]
+        utils.log_info("Folding constant map: " + image_node.image.name + " into: " + socket)
+        if bsdf_node.inputs[socket].type == "RGBA":
+            nodeutils.set_node_input(bsdf_node, socket, (value[0], value[1], value[2], 1.0))
+        else:
+            nodeutils.set_node_input(bsdf_node, socket, value[0])
+        nodes.remove(image_node)
+        return None
+    return image_node
+
+
 def bake_selected_objects():
     props = bpy.context.scene.CC3BakeProps
 
@@ -1261,37 +1734,15 @@ def bake_selected_objects():
     objects = bpy.context.selected_objects.copy()
     active = bpy.context.active_object
 
-    # deselect everything
-    bpy.ops.object.select_all(action='DESELECT')
-    # first create the bake plane
-    bpy.ops.mesh.primitive_plane_add(size=2, enter_editmode=False, align='WORLD', location=(0, 0, 0), scale=(1, 1, 1))
-    bake_surface = bpy.context.active_object
-    # this creates a single quad baking surface, as none of the node setups
-    # use mesh geometry this means we can bake the entirety of the textures with an even sampling.
-
     # go into wireframe mode:
     try:
         shading = bpy.context.space_data.shading.type
         bpy.context.space_data.shading.type = 'WIREFRAME'
     except:
         pass
-    # set cycles bake
-    engine = bpy.context.scene.render.engine
-    bpy.context.scene.render.engine = 'CYCLES'
 
-    materials_done = []
-    obj : bpy.types.Object
-    for obj in objects:
-        if obj.type == "MESH":
-            bake_object(obj, bake_surface, materials_done)
-        elif obj.type == "ARMATURE":
-            for child in obj.children:
-                bake_object(child, bake_surface, materials_done)
-    materials_done.clear()
-
-    bpy.data.objects.remove(bake_surface)
+    bake_objects(objects)
 
-    bpy.context.scene.render.engine = engine
     try:
         bpy.context.space_data.shading.type = shading
     except:
@@ -1302,6 +1753,145 @@ def bake_selected_objects():
     utils.set_active_object(active)
 
 
+def bake_objects(objects, shard = None):
+    """Bakes the materials of the mesh objects and the meshes of the armatures, without any UI or viewport changes.
+
+    shard: the names of the source materials to bake, or None to bake them all,
+           across the bake farm workers if there are any.
+    """
+    props = bpy.context.scene.CC3BakeProps
+
+    profiling = props.profile_bake and profiler.start()
+    try:
+        with profiler.span("bake", "bake"):
+            bake_objects_for_targets(objects, shard)
+    finally:
+        if profiling:
+            profiler.stop()
+            profiler.log_summary()
+            profiler.write_reports(get_bake_path(), vars.PROFILE_TRACE_FILE, vars.PROFILE_CSV_FILE)
+
+
+def bake_objects_for_targets(objects, shard = None):
+    global use_raw_maps
+    props = bpy.context.scene.CC3BakeProps
+
+    if shard is None and props.farm_workers > 1:
+        farm.bake_objects(objects, props.farm_workers)
+        return
+
+    clear_map_timings()
+    clear_image_io()
+
+    targets = get_bake_targets()
+    if len(targets) <= 1:
+        bake_objects_for_target(objects, shard)
+        return
+
+    # bake each target into its own folder, re-using the raw bakes of the previous targets
+    target_mode = props.target_mode
+    bake_path = props.bake_path
+    use_raw_maps = True
+    try:
+        for target in targets:
+            utils.log_info("")
+            utils.log_info("Baking target: " + target)
+            props.target_mode = target
+            props.bake_path = os.path.join(bake_path, target)
+            bake_objects_for_target(objects, shard)
+    finally:
+        use_raw_maps = False
+        clear_raw_maps()
+        props.target_mode = target_mode
+        props.bake_path = bake_path
+
+
+def get_bake_targets():
+    """Returns the multi-target bake targets, in vars.BAKE_TARGETS order with the main target last,
+    so the baked materials left in the blend file are the main target's."""
+    props = bpy.context.scene.CC3BakeProps
+    targets = []
+    for target in vars.BAKE_TARGETS:
+        if target[0] in props.multi_targets and target[0] != props.target_mode:
+            targets.append(target[0])
+    targets.append(props.target_mode)
+    return targets
+
+
+def start_image_writer():
+    global image_writer
+    props = bpy.context.scene.CC3BakeProps
+    image_writer = None
+    if props.write_threads > 0:
+        image_writer = writer.ImageWriter(props.write_threads, props.write_queue)
+
+
+def stop_image_writer():
+    global image_writer
+    if image_writer:
+        image_writer.shutdown()
+    image_writer = None
+    written_images.clear()
+
+
+def bake_objects_for_target(objects, shard = None):
+    """Bakes the objects for the current props.target_mode."""
+
+    # deselect everything
+    bpy.ops.object.select_all(action='DESELECT')
+    # first create the bake plane
+    bpy.ops.mesh.primitive_plane_add(size=2, enter_editmode=False, align='WORLD', location=(0, 0, 0), scale=(1, 1, 1))
+    bake_surface = bpy.context.active_object
+    # this creates a single quad baking surface, as none of the node setups
+    # use mesh geometry this means we can bake the entirety of the textures with an even sampling.
+
+    # set cycles bake, once for the whole run
+    with BakeSession(bpy.context.scene):
+        materials_done = []
+        pending_bakes.clear()
+        pending_writes.clear()
+        written_images.clear()
+        pack_jobs.clear()
+        inverted_images.clear()
+        clear_texture_size_index()
+        clear_image_registry()
+        nodeutils.clear_node_indexes()
+        cc3.clear_material_cache_index()
+        bakecache.clear_manifest()
+        dedup.reset()
+        material_users.clear()
+        material_users.update(build_material_users(bpy.context.scene.objects))
+        start_image_writer()
+        try:
+            obj : bpy.types.Object
+            for obj in objects:
+                if obj.type == "MESH":
+                    bake_object(obj, bake_surface, materials_done, shard)
+                elif obj.type == "ARMATURE":
+                    for child in obj.children:
+                        bake_object(child, bake_surface, materials_done, shard)
+            materials_done.clear()
+
+            flush_pack_jobs()
+            write_pending_images()
+            finish_image_writes()
+            dedup.measure_saved()
+        finally:
+            # never leave writes running after the bake, even if it failed
+            stop_image_writer()
+        bakecache.save_manifest()
+        inverted_images.clear()
+        clear_texture_size_index()
+        clear_image_registry()
+        nodeutils.clear_node_indexes()
+        material_users.clear()
+        dedup.log_report()
+        dedup.reset()
+        utils.log_info("Image encodes: " + str(image_io["encode"]) + ", decodes: " + str(image_io["decode"]))
+
+    bpy.data.objects.remove(bake_surface)
+
+
 
 def next_uid():
     props = bpy.context.scene.CC3BakeProps
@@ -1331,58 +1921,132 @@ def get_target_map_suffix(suffix):
     return "None"
 
 
+# size prop name: attrgetter, of every size prop named in the vars.*_MAPS tables and TEX_SIZE_DETECT
+size_prop_getters = None
+
+
+def get_size_prop_getters():
+    """Builds the size prop accessors once, only for names that are size props of the bake settings."""
+    global size_prop_getters
+    if size_prop_getters is None:
+        names = set(vars.TEX_SIZE_DETECT.keys())
+        for bake_maps in [vars.RL_MAPS] + [vars.get_bake_target_maps(target[0]) for target in vars.BAKE_TARGETS]:
+            names.update([bake_map[1] for bake_map in bake_maps.values()])
+        valid = CC3BakeMaterialSettings.__annotations__
+        size_prop_getters = { name: operator.attrgetter(name) for name in names
+                              if name.isidentifier() and name.endswith("_size") and name in valid }
+    return size_prop_getters
+
+
 def get_int_prop_by_name(props, prop_name):
-    scope = locals()
-    prop_val = eval("props." + prop_name)
-    return int(prop_val)
+    getter = get_size_prop_getters().get(prop_name)
+    if getter is None:
+        raise ValueError("Not a texture size property: " + str(prop_name))
+    return int(getter(props))
+
 
+def get_largest_texture_to_node(node, shader_node, sizes):
+    """Returns the largest texture size upstream of the node.
 
-def get_largest_texture_to_node(node, shader_node, done):
+    sizes: a dictionary of the largest texture size upstream of each node already walked,
+           so each node is only walked once however many sockets lead to it.
+    """
+    if node in sizes:
+        return sizes[node]
+    # guard against node loops
+    sizes[node] = 0
     largest = 0
     for socket in node.inputs:
-        size = get_largest_texture_to_socket(node, socket.name, shader_node, done)
+        size = get_largest_texture_to_socket(node, socket.name, shader_node, sizes)
         if size > largest:
             largest = size
+    sizes[node] = largest
     return largest
 
 
-def get_largest_texture_to_socket(node, socket, shader_node, done = None):
+def get_largest_texture_to_socket(node, socket, shader_node, sizes = None):
 
-    if done is None:
-        done = []
+    if sizes is None:
+        sizes = {}
 
     if socket[-3:] == ":AO":
         connected_node = nodeutils.get_node_connected_to_input(node, socket[:-3])
-        if connected_node.type == "MIX_RGB" and connected_node.blend_type == "MULTIPLY":
+        if connected_node and connected_node.type == "MIX_RGB" and connected_node.blend_type == "MULTIPLY":
             # TODO: Maybe filter for *.(ao|ambient|occlusion)
-            return get_largest_texture_to_socket(connected_node, "Color2", shader_node, done)
+            return get_largest_texture_to_socket(connected_node, "Color2", shader_node, sizes)
 
     elif socket[-8:] == ":DIFFUSE":
         connected_node = nodeutils.get_node_connected_to_input(node, socket[:-8])
-        if connected_node.type == "MIX_RGB" and connected_node.blend_type == "MULTIPLY":
-            return get_largest_texture_to_socket(connected_node, "Color1", shader_node, done)
+        if connected_node and connected_node.type == "MIX_RGB" and connected_node.blend_type == "MULTIPLY":
+            return get_largest_texture_to_socket(connected_node, "Color1", shader_node, sizes)
 
     elif socket[-5:] == ":BUMP":
         connected_node = nodeutils.get_node_connected_to_input(node, socket[:-5])
-        if connected_node.type == "BUMP":
-            return get_largest_texture_to_socket(connected_node, "Height", shader_node, done)
+        if connected_node and connected_node.type == "BUMP":
+            return get_largest_texture_to_socket(connected_node, "Height", shader_node, sizes)
 
     elif socket[-7:] == ":NORMAL":
         connected_node = nodeutils.get_node_connected_to_input(node, socket[:-7])
-        if connected_node.type == "BUMP":
-            return get_largest_texture_to_socket(connected_node, "Normal", shader_node, done)
+        if connected_node and connected_node.type == "BUMP":
+            return get_largest_texture_to_socket(connected_node, "Normal", shader_node, sizes)
 
     else:
         connected_node = nodeutils.get_node_connected_to_input(node, socket)
 
-    if connected_node is None or connected_node in done or connected_node == shader_node:
+    if connected_node is None or connected_node == shader_node:
         return 0
-    done.append(connected_node)
 
     if connected_node.type == "TEX_IMAGE":
         return utils.get_tex_image_size(connected_node)
     else:
-        return get_largest_texture_to_node(connected_node, shader_node, done)
+        return get_largest_texture_to_node(connected_node, shader_node, sizes)
+
+
+# material pointer: texture size index, rebuilt each bake run
+texture_size_index = {}
+
+SIZE_QUALIFIERS = ["", ":AO", ":DIFFUSE", ":BUMP", ":NORMAL"]
+
+
+def clear_texture_size_index():
+    texture_size_index.clear()
+    target_max_sizes.clear()
+
+
+def build_texture_size_index(mat):
+    """Walks the material node tree once and indexes the largest upstream texture of every BSDF input.
+
+    Returns a dictionary of BSDF input name (and input name with any :AO, :DIFFUSE, :BUMP or :NORMAL qualifier)
+    to the largest texture size.
+    """
+    index = {}
+    nodes = mat.node_tree.nodes
+    node_index = nodeutils.get_node_index(nodes)
+    shader_node = nodeutils.get_shader_node(node_index)
+    bsdf_node = nodeutils.get_bsdf_node(node_index)
+    if bsdf_node:
+        sizes = {}
+        for socket in bsdf_node.inputs:
+            for qualifier in SIZE_QUALIFIERS:
+                index[socket.name + qualifier] = get_largest_texture_to_socket(bsdf_node, socket.name + qualifier, shader_node, sizes)
+    return index
+
+
+def get_texture_size_index(mat):
+    key = mat.as_pointer()
+    index = texture_size_index.get(key)
+    if index is None:
+        index = { "inputs": build_texture_size_index(mat), "textures": {}, "detect": {} }
+        texture_size_index[key] = index
+    return index
+
+
+def get_shader_texture_size(mat, index, tex_id):
+    textures = index["textures"]
+    if tex_id not in textures:
+        tex_node = nodeutils.find_shader_texture(nodeutils.get_node_index(mat.node_tree.nodes), tex_id)
+        textures[tex_id] = utils.get_tex_image_size(tex_node) if tex_node is not None else None
+    return textures[tex_id]
 
 
 def get_max_texture_size(mat, tex_list, input_list):
@@ -1395,22 +2059,19 @@ def get_max_texture_size(mat, tex_list, input_list):
 
     max_size = 0
     mat_cache = cc3.get_material_cache(mat)
+    index = get_texture_size_index(mat)
 
     if mat_cache is not None and tex_list is not None:
         for t in tex_list:
-            tex_node = nodeutils.find_shader_texture(mat.node_tree.nodes, t)
-            if tex_node is not None:
-                size = utils.get_tex_image_size(tex_node)
+            size = get_shader_texture_size(mat, index, t)
+            if size is not None:
                 utils.log_info("Found CC3 texture: " + t + " size: " + str(size))
                 if size > max_size:
                     max_size = size
 
     elif input_list is not None and max_size == 0:
-        shader_node = nodeutils.get_shader_node(mat.node_tree.nodes)
-        bsdf_node = nodeutils.get_bsdf_node(mat.node_tree.nodes)
-        max_size = 0
         for i in input_list:
-            size = get_largest_texture_to_socket(bsdf_node, i, shader_node)
+            size = index["inputs"].get(i, 0)
             utils.log_info("Found largest input texture: " + i + " size: " + str(size))
             if size > max_size:
                 max_size = size
@@ -1440,10 +2101,15 @@ def detect_size_from_suffix(mat, suffix):
     if target_map:
         target_size = target_map[1]
         if target_size in vars.TEX_SIZE_DETECT:
-            tex_size_detect = vars.TEX_SIZE_DETECT[target_size]
-            tex_list = tex_size_detect[0]
-            input_list = tex_size_detect[1]
-            return get_max_texture_size(mat, tex_list, input_list)
+            if mat is None or mat.node_tree is None:
+                return vars.NO_SIZE
+            detected = get_texture_size_index(mat)["detect"]
+            if target_size not in detected:
+                tex_size_detect = vars.TEX_SIZE_DETECT[target_size]
+                tex_list = tex_size_detect[0]
+                input_list = tex_size_detect[1]
+                detected[target_size] = get_max_texture_size(mat, tex_list, input_list)
+            return detected[target_size]
 
     # otherwise just return the default of 1024
     return vars.DEFAULT_SIZE
@@ -1451,13 +2117,31 @@ def detect_size_from_suffix(mat, suffix):
 
 
 
-def get_target_map_size(mat, suffix, no_max_override = False):
+# (material pointer, target mode): { map suffix: custom max size }, rebuilt each bake run
+target_max_sizes = {}
 
-    # get either the global default props or the material specific props if they exist...
+
+def get_target_max_sizes(mat):
+    """Returns the custom max size of every map of the target for the material, resolved together once."""
+    props = bpy.context.scene.CC3BakeProps
+    key = (mat.as_pointer() if mat else 0, props.target_mode)
+    sizes = target_max_sizes.get(key)
+    if sizes is None:
+        # get either the global default props or the material specific props if they exist...
+        p = get_material_settings(mat)
+        if p is None:
+            p = props
+        bake_maps = vars.get_bake_target_maps(props.target_mode)
+        getters = get_size_prop_getters()
+        # maps sized by a packed texture name with no size setting of its own, i.e. basemap_size, keep the max size
+        sizes = { suffix: int(getters[bake_map[1]](p)) for suffix, bake_map in bake_maps.items()
+                  if bake_map[1] in getters }
+        target_max_sizes[key] = sizes
+    return sizes
+
+
+def get_target_map_size(mat, suffix, no_max_override = False):
     props = bpy.context.scene.CC3BakeProps
-    p = get_material_settings(mat)
-    if p is None:
-        p = props
 
     # fetch the default size from the the existing textures if possible
     size = detect_size_from_suffix(mat, suffix)
@@ -1467,10 +2151,10 @@ def get_target_map_size(mat, suffix, no_max_override = False):
         return max_size
 
     # if overriding with custom max sizes:
-    bake_maps = vars.get_bake_target_maps(props.target_mode)
     if props.custom_sizes:
-        if suffix in bake_maps:
-            max_size = get_int_prop_by_name(p, bake_maps[suffix][1])
+        max_sizes = get_target_max_sizes(mat)
+        if suffix in max_sizes:
+            max_size = max_sizes[suffix]
             utils.log_info(suffix + " map " + props.target_mode + " maximum map size: " + str(size))
 
     if size > max_size:
@@ -1492,10 +2176,11 @@ def get_target_material_name(name, uid):
     return text
 
 
-def bake_object(obj, bake_surface, materials_done):
+def bake_object(obj, bake_surface, materials_done, shard = None):
     props = bpy.context.scene.CC3BakeProps
 
-    for slot in obj.material_slots:
+    for slot_index in range(0, len(obj.material_slots)):
+        slot = obj.material_slots[slot_index]
         source_mat = slot.material
         bake_cache = get_bake_cache(source_mat)
 
@@ -1513,6 +2198,10 @@ def bake_object(obj, bake_surface, materials_done):
         if bsdf_node is None:
             continue
 
+        # only bake the shard's materials, the rest are baked elsewhere:
+        if shard is not None and source_mat.name not in shard:
+            continue
+
         # only process each material once:
         if source_mat not in materials_done:
             materials_done.append(source_mat)
@@ -1539,12 +2228,9 @@ def bake_object(obj, bake_surface, materials_done):
 
             # replace all of the old baked materials with the new copy:
             if old_mat:
-                for o in bpy.context.scene.objects:
-                    if o != obj and o.type == "MESH" and o.data.materials:
-                        for s in o.material_slots:
-                            if s.material == old_mat:
-                                s.material = bake_mat
+                set_material_users(material_users, old_mat, bake_mat, exclude = obj)
                 # remove the old material once all copies of it have been replaced...
+                material_users.pop(old_mat.as_pointer(), None)
                 bpy.data.materials.remove(old_mat)
 
             # give the new copy the correct name
@@ -1560,15 +2246,84 @@ def bake_object(obj, bake_surface, materials_done):
                 bake_surface.data.materials[0] = bake_mat
 
             #try:
-            bake_material(bake_surface, bake_mat, source_mat)
-            slot.material = bake_mat
+            with profiler.span(source_mat.name, "material", material=source_mat.name):
+                bake_material(bake_surface, bake_mat, source_mat)
+            set_slot_material(obj, slot_index, bake_mat)
             #except:
             #   utils.log_error("Something went horribly wrong!")
 
         else:
             # if the material has already been baked elsewhere, replace the material here
             if bake_cache and slot.material != bake_cache.baked_material:
-                slot.material = bake_cache.baked_material
+                set_slot_material(obj, slot_index, bake_cache.baked_material)
+
+
+# material pointer: [material, [[object, slot index]]] of the mesh material slots using it,
+# built once per bake run, so swapping a material only visits the slots that use it
+material_users = {}
+
+
+def build_material_users(objects):
+    """Returns the mesh material slots of the objects indexed by material, in a single pass."""
+    users = {}
+    for obj in objects:
+        if obj.type == "MESH" and obj.data.materials:
+            for i in range(0, len(obj.material_slots)):
+                mat = obj.material_slots[i].material
+                if mat is not None:
+                    entry = users.get(mat.as_pointer())
+                    if entry is None:
+                        entry = [mat, []]
+                        users[mat.as_pointer()] = entry
+                    entry[1].append([obj, i])
+    return users
+
+
+def set_material_users(users, old_mat, new_mat, objects = None, exclude = None):
+    """Puts new_mat in the slots indexed as using old_mat, only in the objects if given and never in exclude.
+
+    The slots are checked before they are changed, in case they have changed since indexed.
+    """
+    entry = users.get(old_mat.as_pointer())
+    if entry is None:
+        return
+    kept = []
+    moved = []
+    for user in entry[1]:
+        obj, i = user
+        if obj == exclude or (objects is not None and obj not in objects):
+            kept.append(user)
+            continue
+        slot = obj.material_slots[i]
+        if slot.material == old_mat:
+            slot.material = new_mat
+            moved.append(user)
+    entry[1] = kept
+    if moved and new_mat is not None:
+        new_entry = users.get(new_mat.as_pointer())
+        if new_entry is None:
+            new_entry = [new_mat, []]
+            users[new_mat.as_pointer()] = new_entry
+        new_entry[1].extend(moved)
+
+
+def set_slot_material(obj, i, mat):
+    """Sets the material of the object's slot, keeping material_users up to date."""
+    slot = obj.material_slots[i]
+    old_mat = slot.material
+    if old_mat == mat:
+        return
+    slot.material = mat
+    if old_mat is not None:
+        entry = material_users.get(old_mat.as_pointer())
+        if entry:
+            entry[1] = [user for user in entry[1] if user[0] != obj or user[1] != i]
+    if mat is not None:
+        entry = material_users.get(mat.as_pointer())
+        if entry is None:
+            entry = [mat, []]
+            material_users[mat.as_pointer()] = entry
+        entry[1].append([obj, i])
 
 
 def context_material(context):
@@ -1578,38 +2333,124 @@ def context_material(context):
         return None
 
 
+# { collection name: [props pointer, collection length, { material pointer: index of its first entry }] }
+# rebuilt when the collection changes length, or an entry no longer holds the material it is indexed by
+material_indexes = {}
+BAKE_CACHE_MATERIALS = ("source_material", "baked_material")
+MATERIAL_SETTINGS_MATERIALS = ("material",)
+
+
+@bpy.app.handlers.persistent
+def clear_material_indexes(*args):
+    """Undo and loading files reallocate the materials, so their pointers are no longer valid."""
+    material_indexes.clear()
+
+
+def get_material_index(props, name, attrs, rebuild = False):
+    coll = getattr(props, name)
+    index = material_indexes.get(name)
+    if rebuild or index is None or index[0] != props.as_pointer() or index[1] != len(coll):
+        pointers = {}
+        for i in range(0, len(coll)):
+            item = coll[i]
+            for attr in attrs:
+                mat = getattr(item, attr)
+                if mat is not None:
+                    pointers.setdefault(mat.as_pointer(), i)
+        index = [props.as_pointer(), len(coll), pointers]
+        material_indexes[name] = index
+    return index[2]
+
+
+def find_material_entry(props, name, attrs, mat):
+    """Returns the index of the first entry in the collection that holds the material in any of attrs, or -1."""
+    if mat is None:
+        return -1
+    coll = getattr(props, name)
+    pointer = mat.as_pointer()
+    i = get_material_index(props, name, attrs).get(pointer, -1)
+    if i >= 0:
+        item = coll[i]
+        if any(getattr(item, attr) == mat for attr in attrs):
+            return i
+        # the entry has changed since indexed
+        i = get_material_index(props, name, attrs, rebuild=True).get(pointer, -1)
+    return i
+
+
+def index_material_entry(props, name, attrs, mat, i):
+    """Adds the material of the entry at i to the index, keeping the first entry for each material.
+
+    An entry just added to the end of the collection is indexed without rebuilding the index.
+    """
+    index = material_indexes.get(name)
+    if index and index[0] == props.as_pointer() and index[1] == i and i == len(getattr(props, name)) - 1:
+        index[1] = i + 1
+    if mat is not None:
+        pointers = get_material_index(props, name, attrs)
+        pointer = mat.as_pointer()
+        if pointers.get(pointer, i) >= i:
+            pointers[pointer] = i
+
+
+def remove_material_entry(props, name, attrs, i):
+    """Removes the entry at i by moving the last entry into its place.
+
+    No other entry changes index, so the index is updated in place instead of rebuilt.
+    """
+    coll = getattr(props, name)
+    pointers = get_material_index(props, name, attrs)
+    last = len(coll) - 1
+    for attr in attrs:
+        mat = getattr(coll[i], attr)
+        if mat is not None and pointers.get(mat.as_pointer()) == i:
+            del pointers[mat.as_pointer()]
+    if i != last:
+        utils.copy_property_group(coll[last], coll[i])
+        for attr in attrs:
+            mat = getattr(coll[i], attr)
+            if mat is not None and pointers.get(mat.as_pointer()) == last:
+                pointers[mat.as_pointer()] = i
+    coll.remove(last)
+    material_indexes[name][1] = last
+
+
 def get_bake_cache(mat):
     props = bpy.context.scene.CC3BakeProps
-    for bc in props.bake_cache:
-        if bc.source_material == mat or bc.baked_material == mat:
-            return bc
+    i = find_material_entry(props, "bake_cache", BAKE_CACHE_MATERIALS, mat)
+    if i >= 0:
+        return props.bake_cache[i]
     return None
 
 
 def add_bake_cache(uid, source_mat, bake_mat):
     props = bpy.context.scene.CC3BakeProps
-    bc = get_bake_cache(source_mat)
-    if bc is None:
+    i = find_material_entry(props, "bake_cache", BAKE_CACHE_MATERIALS, source_mat)
+    if i >= 0:
+        bc = props.bake_cache[i]
+    else:
         bc = props.bake_cache.add()
         bc.uid = uid
         bc.source_material = source_mat
+        i = len(props.bake_cache) - 1
+        index_material_entry(props, "bake_cache", BAKE_CACHE_MATERIALS, source_mat, i)
     bc.baked_material = bake_mat
+    index_material_entry(props, "bake_cache", BAKE_CACHE_MATERIALS, bake_mat, i)
     return bc
 
 
 def remove_bake_cache(mat):
     props = bpy.context.scene.CC3BakeProps
-    bc = get_bake_cache(mat)
-    if bc:
-        utils.remove_collection(props.bake_cache, bc)
+    i = find_material_entry(props, "bake_cache", BAKE_CACHE_MATERIALS, mat)
+    if i >= 0:
+        remove_material_entry(props, "bake_cache", BAKE_CACHE_MATERIALS, i)
 
 
 def get_material_settings(mat):
     props = bpy.context.scene.CC3BakeProps
-    if mat:
-        for ms in props.material_settings:
-            if ms.material == mat:
-                return ms
+    i = find_material_entry(props, "material_settings", MATERIAL_SETTINGS_MATERIALS, mat)
+    if i >= 0:
+        return props.material_settings[i]
     return None
 
 
@@ -1619,6 +2460,8 @@ def add_material_settings(mat):
     if ms is None:
         ms = props.material_settings.add()
         ms.material = mat
+        index_material_entry(props, "material_settings", MATERIAL_SETTINGS_MATERIALS, mat,
+                             len(props.material_settings) - 1)
         ms.diffuse_size = props.diffuse_size
         ms.ao_size = props.ao_size
         ms.sss_size = props.sss_size
@@ -1638,29 +2481,25 @@ def add_material_settings(mat):
 
 def remove_material_settings(mat):
     props = bpy.context.scene.CC3BakeProps
-    for ms in props.material_settings:
-        if ms.material == mat:
-            utils.remove_collection(props.material_settings, ms)
+    i = find_material_entry(props, "material_settings", MATERIAL_SETTINGS_MATERIALS, mat)
+    if i >= 0:
+        remove_material_entry(props, "material_settings", MATERIAL_SETTINGS_MATERIALS, i)
 
 
 def revert_materials(objects):
-    for obj in objects:
-        if obj.type == "MESH":
-            for i in range(0, len(obj.data.materials)):
-                mat = obj.data.materials[i]
-                bc = get_bake_cache(mat)
-                if bc and bc.baked_material == mat:
-                    obj.data.materials[i] = bc.source_material
+    users = build_material_users(objects)
+    for mat, _ in list(users.values()):
+        bc = get_bake_cache(mat)
+        if bc and bc.baked_material == mat:
+            set_material_users(users, mat, bc.source_material)
 
 
 def restore_baked_materials(objects):
-    for obj in objects:
-        if obj.type == "MESH":
-            for i in range(0, len(obj.data.materials)):
-                mat = obj.data.materials[i]
-                bc = get_bake_cache(mat)
-                if bc and bc.source_material == mat:
-                    obj.data.materials[i] = bc.baked_material
+    users = build_material_users(objects)
+    for mat, _ in list(users.values()):
+        bc = get_bake_cache(mat)
+        if bc and bc.source_material == mat:
+            set_material_users(users, mat, bc.baked_material)
 
 
 class CC3Baker(bpy.types.Operator):
@@ -1888,6 +2727,11 @@ class CC3BakePanel(bpy.types.Panel):
         col_2.prop(props, "target_mode", text="", slider = True)
         col_1.label(text="Bake Samples")
         col_2.prop(props, "bake_samples", text="", slider = True)
+        col_1.label(text="Adaptive Samples")
+        col_2.prop(props, "adaptive_samples", text="")
+        if props.adaptive_samples:
+            col_1.label(text="Check Convergence")
+            col_2.prop(props, "check_convergence", text="")
         col_1.label(text="Format")
         col_2.prop(props, "target_format", text="", slider = True)
         if props.target_format == "JPEG":
@@ -1909,9 +2753,30 @@ class CC3BakePanel(bpy.types.Panel):
         if props.target_mode == "UNITY_HDRP" or props.target_mode == "UNITY_URP":
             col_1.label(text="Smoothness Mapping")
             col_2.prop(props, "smoothness_mapping", text="")
+            col_1.label(text="Smoothness LUT")
+            col_2.prop(props, "smoothness_lut", text="")
         if props.target_mode == "GLTF":
             col_1.label(text="Pack GLTF")
             col_2.prop(props, "pack_gltf", text="")
+        if vars.get_bake_target_packs(props.target_mode):
+            col_1.label(text="Pack Threads")
+            col_2.prop(props, "pack_threads", text="", slider = True)
+        col_1.label(text="Batch Bakes")
+        col_2.prop(props, "batch_bakes", text="")
+        col_1.label(text="Also Bake For")
+        col_2.prop(props, "multi_targets", text="")
+        col_1.label(text="Bake Workers")
+        col_2.prop(props, "farm_workers", text="", slider = True)
+        col_1.label(text="Bake Cache")
+        col_2.prop(props, "use_bake_cache", text="")
+        col_1.label(text="Share Identical Maps")
+        col_2.prop(props, "dedup_maps", text="")
+        col_1.label(text="Constant Maps")
+        col_2.prop(props, "constant_maps", text="")
+        col_1.label(text="Write Threads")
+        col_2.prop(props, "write_threads", text="", slider = True)
+        col_1.label(text="Reload Images")
+        col_2.prop(props, "reload_images", text="")
         col_1.label(text="Bake Folder")
         col_2.prop(props, "bake_path", text="")
         col_1.separator()
@@ -2004,6 +2869,22 @@ class CC3BakeUtilityPanel(bpy.types.Panel):
         row.scale_y = 2
         row.operator("cc3.jpegify", icon="PLAY", text="Jpegify")
 
+        layout.separator()
+        layout.prop(props, "profile_bake", text="Profile Bake")
+        if props.profile_bake and profiler.summary:
+            box = layout.box()
+            grid = box.grid_flow(row_major=True, columns=4, even_columns=False)
+            grid.label(text="Stage")
+            grid.label(text="Count")
+            grid.label(text="Total")
+            grid.label(text="MB")
+            for category, name, count, total, longest, written in profiler.summary:
+                if category == "stage" or category == "bake":
+                    grid.label(text=name)
+                    grid.label(text=str(count))
+                    grid.label(text=f"{total:.2f}s")
+                    grid.label(text=f"{written / (1024 * 1024):.1f}" if written else "")
+
 
 class CC3BakeCache(bpy.types.PropertyGroup):
     uid: bpy.props.IntProperty(default=0)
@@ -2043,13 +2924,28 @@ class CC3BakeProps(bpy.types.PropertyGroup):
     target_format: bpy.props.EnumProperty(items=vars.TARGET_FORMATS, default="JPEG")
 
     bake_samples: bpy.props.IntProperty(default=5, min=1, max=64, description="The number of texture samples per pixel to bake. As there are no ray traced effects involved, 1 to 5 samples is usually enough.")
+    adaptive_samples: bpy.props.BoolProperty(default=False, description="Bake maps that only read textures at their own resolution with a single sample, and only use the full bake samples for maps with procedural textures, hard masks, bump or ray traced nodes")
+    check_convergence: bpy.props.BoolProperty(default=False, description="Bake every reduced sample map again with twice the samples, and with the full bake samples if the two bakes differ visibly")
     ao_in_diffuse: bpy.props.FloatProperty(default=0, min=0, max=1, description="How much of the ambient occlusion to bake into the diffuse")
 
     smoothness_mapping: bpy.props.EnumProperty(items=vars.CONVERSION_FUNCTIONS, default="IR", description="Roughness to smoothness calculation")
+    smoothness_lut: bpy.props.EnumProperty(items=vars.LUT_MODES, default="NONE", description="Convert roughness to smoothness with a lookup table. Only for roughness sourced from 8 or 16 bit textures")
 
     allow_bump_maps: bpy.props.BoolProperty(default=True, description="Allow separate Bump and Normal Maps")
     scale_maps: bpy.props.BoolProperty(default=False)
     pack_gltf: bpy.props.BoolProperty(default=True, description="Pack AO, Roughness and Metallic into a single Texture for GLTF")
+    batch_bakes: bpy.props.BoolProperty(default=False, description="Bake up to three scalar maps (roughness, metallic, specular etc.) of a material together in a single bake, one in each color channel")
+    multi_targets: bpy.props.EnumProperty(items=vars.BAKE_TARGETS, options={"ENUM_FLAG"}, default=set(), description="Also bake for these targets in the same bake, each into a sub-folder of the bake folder. Any map already baked for another target is reused instead of baked again")
+    write_threads: bpy.props.IntProperty(default=2, min=0, max=16, description="Encode and write the baked PNG textures on this many background threads while baking carries on. 0 writes every texture on the main thread")
+    write_queue: bpy.props.IntProperty(default=4, min=1, max=64, description="The most textures waiting to be written at once. Each waiting texture holds a copy of its pixels in memory")
+    reload_images: bpy.props.BoolProperty(default=False, description="Reload the baked images from their files once written, to see exactly what was saved. Otherwise the baked pixels are kept as they are")
+    profile_bake: bpy.props.BoolProperty(default=False, description="Time every stage of the bake, for every material and map, and write a Chrome trace and CSV of the timings to the bake folder")
+    farm_workers: bpy.props.IntProperty(default=1, min=1, max=64, description="Bake the materials across this many background Blender processes at once. The blend file must be saved. 1 bakes everything in this Blender")
+    use_bake_cache: bpy.props.BoolProperty(default=False, description="Skip baking any map whose source nodes, textures and bake settings have not changed since it was last baked into the bake folder")
+    dedup_maps: bpy.props.BoolProperty(default=False, description="Materials that bake or copy identical maps share a single texture instead of saving a copy each")
+    constant_maps: bpy.props.EnumProperty(items=vars.CONSTANT_MAP_MODES, default="FULL", description="What to do with baked maps that are a single value")
+    pack_threads: bpy.props.IntProperty(default=1, min=1, max=64, description="Pack the textures of this many materials at once, after all the materials have been baked. 1 packs each material as soon as it is baked")
+    pack_band_rows: bpy.props.IntProperty(default=256, min=1, max=8192, description="The number of image rows to convert at a time when packing textures. Lower values use less memory")
 
     custom_sizes: bpy.props.BoolProperty(default=False)
     bake_mixers: bpy.props.BoolProperty(default=True, description="Bake the result of any Color ID/RGB mask mixers on the materials")
@@ -0,0 +1,231 @@
+import bpy
+import os
+import json
+import time
+import hashlib
+import contextlib
+from . import utils
+from . import vars
+
+# node properties that don't change what the node computes
+IGNORED_NODE_PROPS = {
+    "rna_type", "type", "location", "width", "width_hidden", "height", "dimensions",
+    "name", "label", "parent", "select", "show_options", "show_preview", "hide",
+    "mute", "show_texture", "use_custom_color", "color", "bl_idname", "bl_label",
+    "bl_description", "bl_icon", "bl_static_type", "bl_width_default", "bl_width_min",
+    "bl_width_max", "bl_height_default", "bl_height_min", "bl_height_max",
+    "internal_links", "inputs", "outputs",
+}
+
+HASHED_PROP_TYPES = {"BOOLEAN", "INT", "FLOAT", "STRING", "ENUM"}
+
+manifest = None
+manifest_path = None
+# the file names stored into the manifest by this process, only these are merged into the file on save
+stored = set()
+
+
+def get_value_key(value):
+    try:
+        return repr(tuple(value))
+    except:
+        return repr(value)
+
+
+def get_image_key(image):
+    """Identifies the image by its source file, file size and modified time."""
+    if image is None:
+        return "None"
+    key = [image.name, image.source, str(tuple(image.size)), image.colorspace_settings.name]
+    if image.packed_file:
+        key.append(str(image.packed_file.size))
+    elif image.filepath:
+        path = bpy.path.abspath(image.filepath)
+        key.append(os.path.normcase(os.path.realpath(path)))
+        try:
+            stat = os.stat(path)
+            key.append(str(stat.st_size))
+            key.append(str(stat.st_mtime))
+        except:
+            key.append("missing")
+    if image.is_dirty:
+        # unsaved changes can't be identified without hashing the pixels, so never match
+        key.append(os.urandom(8).hex())
+    return "|".join(key)
+
+
+def hash_color_ramp(hasher, color_ramp):
+    hasher.update((color_ramp.color_mode + "|" + color_ramp.interpolation + "|" +
+                   color_ramp.hue_interpolation).encode())
+    for element in color_ramp.elements:
+        hasher.update((repr(element.position) + "=" + get_value_key(element.color)).encode())
+
+
+def hash_curve_mapping(hasher, mapping):
+    hasher.update((get_value_key(mapping.black_level) + "|" + get_value_key(mapping.white_level) + "|" +
+                   str(mapping.use_clip) + "|" + get_value_key(mapping.clip_min_x) + "|" +
+                   get_value_key(mapping.clip_min_y) + "|" + get_value_key(mapping.clip_max_x) + "|" +
+                   get_value_key(mapping.clip_max_y)).encode())
+    for curve in mapping.curves:
+        hasher.update(b"curve")
+        for point in curve.points:
+            hasher.update((get_value_key(point.location) + point.handle_type).encode())
+
+
+def hash_node(hasher, node, done):
+    if node is None or node in done:
+        return
+    done.add(node)
+
+    hasher.update(node.bl_idname.encode())
+    for prop in node.bl_rna.properties:
+        identifier = prop.identifier
+        if identifier in IGNORED_NODE_PROPS:
+            continue
+        if prop.type in HASHED_PROP_TYPES:
+            try:
+                hasher.update((identifier + "=" + get_value_key(getattr(node, identifier))).encode())
+            except:
+                pass
+
+    # the pointer properties, i.e. of the color ramp and RGB curves nodes
+    if getattr(node, "color_ramp", None):
+        hash_color_ramp(hasher, node.color_ramp)
+    if getattr(node, "mapping", None) and hasattr(node.mapping, "curves"):
+        hash_curve_mapping(hasher, node.mapping)
+
+    if node.type == "TEX_IMAGE":
+        hasher.update(get_image_key(node.image).encode())
+    elif node.type == "GROUP" and node.node_tree:
+        hash_node_tree(hasher, node.node_tree, done)
+
+    # the value and RGB nodes hold their value on their output
+    for socket in node.outputs:
+        if hasattr(socket, "default_value"):
+            hasher.update((socket.identifier + "->" + get_value_key(socket.default_value)).encode())
+
+    for socket in node.inputs:
+        if socket.is_linked:
+            for link in socket.links:
+                hasher.update((socket.identifier + "<-" + link.from_node.name + "." + link.from_socket.identifier).encode())
+                hash_node(hasher, link.from_node, done)
+        elif hasattr(socket, "default_value"):
+            hasher.update((socket.identifier + "=" + get_value_key(socket.default_value)).encode())
+
+
+def hash_node_tree(hasher, node_tree, done):
+    if node_tree in done:
+        return
+    done.add(node_tree)
+    hasher.update(node_tree.name.encode())
+    for node in node_tree.nodes:
+        hash_node(hasher, node, done)
+
+
+def get_bake_key(node, socket, settings):
+    """Returns a content hash of everything upstream of the node socket, and the bake settings."""
+    hasher = hashlib.sha1()
+    hasher.update(get_value_key(settings).encode())
+    hasher.update(str(socket).encode())
+    hash_node(hasher, node, set())
+    return hasher.hexdigest()
+
+
+def load_manifest(bake_path):
+    global manifest, manifest_path
+    path = os.path.join(bake_path, vars.BAKE_CACHE_FILE)
+    if manifest is not None and manifest_path == path:
+        return manifest
+    manifest_path = path
+    manifest = {}
+    try:
+        with open(path, "r") as file:
+            manifest = json.load(file)
+    except:
+        pass
+    return manifest
+
+
+def clear_manifest():
+    global manifest, manifest_path
+    manifest = None
+    manifest_path = None
+    stored.clear()
+
+
+@contextlib.contextmanager
+def file_lock(path, timeout = vars.BAKE_CACHE_LOCK_TIMEOUT):
+    """Holds an exclusive lock file next to path, across processes, for the enclosed code."""
+    lock_path = path + ".lock"
+    while True:
+        try:
+            lock = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > timeout:
+                    utils.log_warn("Breaking stale bake cache lock: " + lock_path)
+                    os.remove(lock_path)
+            except OSError:
+                pass
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        os.close(lock)
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+
+
+def save_manifest():
+    """Merges the entries stored by this process into the manifest file.
+
+    Other bake processes (i.e. the bake farm workers) may have written to it since it was loaded,
+    so it is read again and written under a file lock, and only the entries stored here replace theirs.
+    """
+    if manifest is not None and manifest_path and stored:
+        try:
+            os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+            with file_lock(manifest_path):
+                merged = {}
+                try:
+                    with open(manifest_path, "r") as file:
+                        merged = json.load(file)
+                except:
+                    pass
+                for name in stored:
+                    merged[name] = manifest[name]
+                temp_path = manifest_path + ".tmp"
+                with open(temp_path, "w") as file:
+                    json.dump(merged, file, indent=1)
+                os.replace(temp_path, manifest_path)
+        except Exception as e:
+            utils.log_warn("Unable to write bake cache: " + manifest_path + " " + str(e))
+    clear_manifest()
+
+
+def get_file_key(filepath):
+    try:
+        stat = os.stat(filepath)
+        return [stat.st_size, stat.st_mtime]
+    except:
+        return None
+
+
+def is_cached(bake_path, filepath, key):
+    """Returns True if the file in the bake folder was baked from exactly the same content and settings."""
+    entry = load_manifest(bake_path).get(os.path.basename(filepath))
+    if entry and entry.get("key") == key:
+        return entry.get("file") == get_file_key(filepath)
+    return False
+
+
+def store(bake_path, filepath, key):
+    """Records the content key of the file just written to the bake folder."""
+    file_key = get_file_key(filepath)
+    if file_key:
+        name = os.path.basename(filepath)
+        load_manifest(bake_path)[name] = { "key": key, "file": file_key }
+        stored.add(name)
@@ -0,0 +1,615 @@
+"""Micro-benchmarks of the bake cache, material settings and CC3 material cache lookups,
+of channel packing against the per-pixel loop it replaced,
+and of making the bake images of a first bake against saving an empty placeholder for each.
+
+Run headless, in an empty scene, with:
+
+    blender -b --factory-startup --python-expr "import <addon>.benchmark; <addon>.benchmark.main()"
+
+where <addon> is the folder name the add-on is installed as.
+The indexed lookups are timed against the linear search they replace.
+The CC3 material cache benchmark needs the CC3 import add-on, for its CC3ImportProps.
+
+The tests run the same way, with <addon>.benchmark.run_tests(), in an unsaved session
+(the bake farm test saves it to a temporary folder).
+"""
+
+import bpy
+import os
+import math
+import sys
+import json
+import time
+import shutil
+import tempfile
+import numpy
+from . import utils
+from . import vars
+from . import cc3
+from . import bake
+from . import bakecache
+from . import nodeutils
+from . import farm
+from . import packer
+
+BENCHMARK_PREFIX = "cc3_bake_benchmark_"
+
+
+def linear_get_bake_cache(props, mat):
+    for bc in props.bake_cache:
+        if bc.source_material == mat or bc.baked_material == mat:
+            return bc
+    return None
+
+
+def linear_get_material_settings(props, mat):
+    for ms in props.material_settings:
+        if ms.material == mat:
+            return ms
+    return None
+
+
+def linear_get_material_cache(props, mat):
+    for chr_cache in props.import_cache:
+        for name in cc3.MATERIAL_CACHES:
+            for cache in getattr(chr_cache, name):
+                if cache.material == mat:
+                    return cache
+    return None
+
+
+def time_lookups(function, materials):
+    start = time.perf_counter()
+    for mat in materials:
+        function(mat)
+    return (time.perf_counter() - start) / max(1, len(materials))
+
+
+def run(count = 10000, lookups = 1000, linear_lookups = 100):
+    """Times adding count entries, looking them up and removing some of them. Returns the timings in seconds.
+
+    Any bake cache and material settings already in the scene are left as they are,
+    only the entries added here are removed again.
+    """
+    props = bpy.context.scene.CC3BakeProps
+    bake.clear_material_indexes()
+
+    sources = [bpy.data.materials.new(BENCHMARK_PREFIX + "source_" + str(i)) for i in range(0, count)]
+    baked = [bpy.data.materials.new(BENCHMARK_PREFIX + "baked_" + str(i)) for i in range(0, count)]
+    step = max(1, count // lookups)
+    linear_step = max(1, count // linear_lookups)
+    results = {}
+
+    try:
+        start = time.perf_counter()
+        for i in range(0, count):
+            bake.add_bake_cache(i, sources[i], baked[i])
+            bake.add_material_settings(sources[i])
+        results["add"] = (time.perf_counter() - start) / count
+
+        results["bake_cache"] = time_lookups(bake.get_bake_cache, baked[::step])
+        results["bake_cache_linear"] = time_lookups(lambda mat: linear_get_bake_cache(props, mat), baked[::linear_step])
+        results["material_settings"] = time_lookups(bake.get_material_settings, sources[::step])
+        results["material_settings_linear"] = time_lookups(lambda mat: linear_get_material_settings(props, mat),
+                                                           sources[::linear_step])
+
+        removed = sources[::linear_step]
+        start = time.perf_counter()
+        for mat in removed:
+            bake.remove_bake_cache(mat)
+            bake.remove_material_settings(mat)
+        results["remove"] = (time.perf_counter() - start) / len(removed)
+
+    finally:
+        for mat in sources:
+            bake.remove_bake_cache(mat)
+            bake.remove_material_settings(mat)
+        bake.clear_material_indexes()
+        for mat in sources + baked:
+            bpy.data.materials.remove(mat)
+
+    return results
+
+
+def run_material_cache(characters = 10, materials = 20):
+    """Times the CC3 material cache lookup over characters imported characters,
+    with materials in each of their material caches. Returns the timings in seconds."""
+    props = bpy.context.scene.CC3ImportProps
+    first = len(props.import_cache)
+    created = []
+    results = {}
+
+    try:
+        for c in range(0, characters):
+            chr_cache = props.import_cache.add()
+            for name in cc3.MATERIAL_CACHES:
+                caches = getattr(chr_cache, name)
+                for i in range(0, materials):
+                    mat = bpy.data.materials.new(BENCHMARK_PREFIX + str(c) + "_" + name + "_" + str(i))
+                    created.append(mat)
+                    caches.add().material = mat
+
+        cc3.clear_material_cache_index()
+        start = time.perf_counter()
+        cc3.get_material_cache(created[0])
+        results["material_cache_build"] = time.perf_counter() - start
+        results["material_cache"] = time_lookups(cc3.get_material_cache, created)
+        results["material_cache_linear"] = time_lookups(lambda mat: linear_get_material_cache(props, mat), created)
+
+    finally:
+        while len(props.import_cache) > first:
+            props.import_cache.remove(len(props.import_cache) - 1)
+        cc3.clear_material_cache_index()
+        for mat in created:
+            bpy.data.materials.remove(mat)
+
+    return results
+
+
+# a stand in for the Blender bake farm worker: writes a result for its shard without baking anything
+FAKE_WORKER = """import os, sys, json
+args = sys.argv[sys.argv.index("--") + 1:]
+with open(args[args.index("--farm-job") + 1], "r", encoding="utf-8") as file:
+    job = json.load(file)
+failed = os.environ.get("CC3_BAKE_FAKE_WORKER_FAIL") == "1"
+result = {
+    "status": "FAILED" if failed else "OK",
+    "error": "fake worker failure" if failed else "",
+    "materials": [],
+    "maps": [{ "target": "", "material": name, "map": "Diffuse", "image": "", "seconds": 0.0 }
+             for name in job["materials"]],
+}
+with open(job["result"], "w", encoding="utf-8") as file:
+    json.dump(result, file)
+sys.exit(1 if failed else 0)
+"""
+
+
+def make_fake_worker(folder):
+    """Writes the fake worker script and an executable that runs it, for farm.bake_objects(executable=...)."""
+    script_path = os.path.join(folder, "fake_worker.py")
+    with open(script_path, "w", encoding="utf-8") as file:
+        file.write(FAKE_WORKER)
+    if os.name == "nt":
+        executable = os.path.join(folder, "fake_worker.bat")
+        with open(executable, "w") as file:
+            file.write(f'@"{sys.executable}" "{script_path}" %*\n')
+    else:
+        executable = os.path.join(folder, "fake_worker")
+        with open(executable, "w") as file:
+            file.write("#!" + sys.executable + "\n" + FAKE_WORKER)
+        os.chmod(executable, 0o755)
+    return executable
+
+
+def test_bake_cache_merge():
+    """Saving the bake cache keeps the entries other workers wrote since it was loaded,
+    and breaks a lock left behind by a crashed worker."""
+    folder = tempfile.mkdtemp(prefix=BENCHMARK_PREFIX)
+    try:
+        bakecache.clear_manifest()
+        path = os.path.join(folder, vars.BAKE_CACHE_FILE)
+        with open(path, "w") as file:
+            json.dump({ "a.png": { "key": "old", "file": [0, 0] },
+                        "b.png": { "key": "old", "file": [0, 0] } }, file)
+        bakecache.load_manifest(folder)
+
+        # another worker bakes b and c after this one has loaded the bake cache
+        with open(path, "w") as file:
+            json.dump({ "a.png": { "key": "old", "file": [0, 0] },
+                        "b.png": { "key": "other", "file": [0, 0] },
+                        "c.png": { "key": "other", "file": [0, 0] } }, file)
+        image_path = os.path.join(folder, "a.png")
+        with open(image_path, "wb") as file:
+            file.write(b"a")
+        bakecache.store(folder, image_path, "mine")
+
+        lock_path = path + ".lock"
+        open(lock_path, "w").close()
+        stale = time.time() - vars.BAKE_CACHE_LOCK_TIMEOUT - 1
+        os.utime(lock_path, (stale, stale))
+        bakecache.save_manifest()
+
+        with open(path, "r") as file:
+            merged = json.load(file)
+        assert merged["a.png"]["key"] == "mine", merged
+        assert merged["b.png"]["key"] == "other", merged
+        assert merged["c.png"]["key"] == "other", merged
+        assert not os.path.exists(lock_path)
+    finally:
+        bakecache.clear_manifest()
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def test_farm_shards(materials = 7, workers = 3):
+    """Runs the bake farm with fake workers: the shards must cover every material exactly once,
+    the workers' map timings must be merged, and a failing worker must fail the bake."""
+    if bpy.data.is_saved:
+        utils.log_info("Skipping the bake farm test, it needs an unsaved session.")
+        return
+    props = bpy.context.scene.CC3BakeProps
+    bake_path = props.bake_path
+    folder = tempfile.mkdtemp(prefix=BENCHMARK_PREFIX)
+    mats = []
+    objects = []
+    try:
+        bpy.ops.wm.save_as_mainfile(filepath=os.path.join(folder, "farm_test.blend"))
+        props.bake_path = os.path.join(folder, "Bake")
+        executable = make_fake_worker(folder)
+        for i in range(0, materials):
+            mat = bpy.data.materials.new(BENCHMARK_PREFIX + "farm_" + str(i))
+            mat.use_nodes = True
+            mats.append(mat)
+        for i in range(0, 2):
+            mesh = bpy.data.meshes.new(BENCHMARK_PREFIX + "farm_" + str(i))
+            for mat in mats[i::2]:
+                mesh.materials.append(mat)
+            obj = bpy.data.objects.new(mesh.name, mesh)
+            bpy.context.scene.collection.objects.link(obj)
+            objects.append(obj)
+
+        farm.bake_objects(objects, workers, executable = executable)
+
+        names = [mat.name for mat in mats]
+        farm_path = os.path.join(bake.get_bake_path(), vars.FARM_FOLDER)
+        sharded = []
+        for i in range(0, workers):
+            with open(os.path.join(farm_path, "shard_" + str(i) + ".json"), "r", encoding="utf-8") as file:
+                sharded.extend(json.load(file)["materials"])
+        assert sorted(sharded) == sorted(names), sharded
+        assert sorted([timing["material"] for timing in bake.map_timings]) == sorted(names)
+
+        os.environ["CC3_BAKE_FAKE_WORKER_FAIL"] = "1"
+        try:
+            farm.bake_objects(objects, workers, executable = executable)
+        except Exception:
+            pass
+        else:
+            raise AssertionError("A failed bake worker did not fail the bake farm")
+
+    finally:
+        os.environ.pop("CC3_BAKE_FAKE_WORKER_FAIL", None)
+        props.bake_path = bake_path
+        for mat in mats:
+            bake.remove_bake_cache(mat)
+        for obj in objects:
+            mesh = obj.data
+            bpy.data.objects.remove(obj)
+            bpy.data.meshes.remove(mesh)
+        for mat in mats:
+            bpy.data.materials.remove(mat)
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+# the smoothness formulas of vars.CONVERSION_FUNCTIONS, written out separately from the packer's
+ANALYTIC_SMOOTHNESS = {
+    "IR": lambda r: 1 - r,
+    "SIR": lambda r: (1 - r) ** 2,
+    "IRS": lambda r: 1 - r ** 2,
+    "IRSR": lambda r: 1 - math.sqrt(r),
+    "SRIR": lambda r: math.sqrt(1 - r),
+    "SRIRS": lambda r: math.sqrt(1 - r ** 2),
+}
+
+
+def test_smoothness_luts():
+    """Every smoothness lookup table, and the exact function, must match the formula
+    within one quantization step, for every 8 and 16 bit roughness level."""
+    for mapping, label, description in vars.CONVERSION_FUNCTIONS:
+        formula = ANALYTIC_SMOOTHNESS[mapping]
+        exact = packer.get_smoothness_function(mapping)
+        for bits in (8, 16):
+            levels = (1 << bits) - 1
+            # as Blender holds the pixels of 8 and 16 bit textures
+            roughness = (numpy.arange(0, levels + 1, dtype=numpy.float64) / levels).astype(numpy.float32)
+            expected = numpy.array([formula(r) for r in roughness.astype(numpy.float64)])
+            lut = packer.get_smoothness_function(mapping, bits)
+            for name, function in (("exact", exact), ("LUT", lut)):
+                result = function(roughness)
+                assert result.dtype == numpy.float32, (mapping, name, result.dtype)
+                error = float(numpy.max(numpy.abs(result.astype(numpy.float64) - expected)))
+                assert error <= 1.0 / levels, (mapping, label, name, bits, error)
+            assert abs(lut(0.5) - formula(0.5)) < 1e-9, (mapping, bits)
+
+
+def make_deep_material(layers, width, images):
+    """Makes a material with layers of width mix nodes feeding the base color of its BSDF,
+    every node taking both colors from the layer below, so there are width^layers paths through it.
+    The bottom layer takes the first image and the middle layer the second, through their Fac inputs."""
+    mat = bpy.data.materials.new(BENCHMARK_PREFIX + "deep_" + str(layers) + "_" + str(width))
+    mat.use_nodes = True
+    nodes = mat.node_tree.nodes
+    links = mat.node_tree.links
+    bsdf_node = next(node for node in nodes if node.type == "BSDF_PRINCIPLED")
+    below = []
+    for image in images:
+        tex_node = nodes.new("ShaderNodeTexImage")
+        tex_node.image = image
+        below.append(tex_node)
+    bottom, middle = below
+    below = [bottom]
+    for layer in range(0, layers):
+        layer_nodes = [nodes.new("ShaderNodeMixRGB") for i in range(0, width)]
+        for i, node in enumerate(layer_nodes):
+            links.new(below[i % len(below)].outputs[0], node.inputs["Color1"])
+            links.new(below[(i + 1) % len(below)].outputs[0], node.inputs["Color2"])
+            if layer == layers // 2:
+                links.new(middle.outputs[0], node.inputs["Fac"])
+        below = layer_nodes
+    links.new(below[0].outputs[0], bsdf_node.inputs["Base Color"])
+    return mat
+
+
+def test_texture_size_index_scaling(layers = (50, 100, 200, 400), width = 2):
+    """build_texture_size_index must walk deep, many-path node graphs in time linear in the number of nodes,
+    and still find the largest texture."""
+    images = [bpy.data.images.new(BENCHMARK_PREFIX + "deep_small", 64, 32),
+              bpy.data.images.new(BENCHMARK_PREFIX + "deep_large", 128, 256)]
+    walk = bake.get_largest_texture_to_node
+    walked = [0]
+
+    def counted_walk(node, shader_node, sizes):
+        walked[0] += 1
+        return walk(node, shader_node, sizes)
+
+    mats = []
+    results = []
+    bake.get_largest_texture_to_node = counted_walk
+    try:
+        for count in layers:
+            mat = make_deep_material(count, width, images)
+            mats.append(mat)
+            nodeutils.clear_node_indexes()
+            walked[0] = 0
+            start = time.perf_counter()
+            index = bake.build_texture_size_index(mat)
+            seconds = time.perf_counter() - start
+            node_count = len(mat.node_tree.nodes)
+            assert index["Base Color"] == 256, (count, index["Base Color"])
+            results.append((node_count, walked[0], seconds))
+            utils.log_info(f"Texture size index: {node_count:6d} nodes {walked[0]:8d} walks {seconds * 1000:10.2f} ms")
+    finally:
+        bake.get_largest_texture_to_node = walk
+        nodeutils.clear_node_indexes()
+        for mat in mats:
+            bpy.data.materials.remove(mat)
+        for image in images:
+            bpy.data.images.remove(image)
+
+    # every call is one link followed, and each node's inputs are only followed once
+    first_nodes, first_walks, first_seconds = results[0]
+    for node_count, walks, seconds in results:
+        assert walks <= 4 * node_count, (node_count, walks)
+        # leave room for timing noise, an exponential walk would be far outside it
+        assert seconds / node_count <= 4 * max(first_seconds / first_nodes, 1e-6), (node_count, seconds)
+
+
+def test_bake_key_changes():
+    """Editing the value of a value node, a color ramp or RGB curves upstream of a socket must change its bake key."""
+    mat = bpy.data.materials.new(BENCHMARK_PREFIX + "bake_key")
+    try:
+        mat.use_nodes = True
+        nodes = mat.node_tree.nodes
+        links = mat.node_tree.links
+        bsdf_node = next(node for node in nodes if node.type == "BSDF_PRINCIPLED")
+        value_node = nodes.new("ShaderNodeValue")
+        ramp_node = nodes.new("ShaderNodeValToRGB")
+        curves_node = nodes.new("ShaderNodeRGBCurve")
+        links.new(value_node.outputs[0], ramp_node.inputs["Fac"])
+        links.new(ramp_node.outputs["Color"], curves_node.inputs["Color"])
+        links.new(curves_node.outputs["Color"], bsdf_node.inputs["Base Color"])
+        settings = ["Diffuse", 1024]
+
+        def changed(edit):
+            before = bakecache.get_bake_key(bsdf_node, "Base Color", settings)
+            edit()
+            return bakecache.get_bake_key(bsdf_node, "Base Color", settings) != before
+
+        assert bakecache.get_bake_key(bsdf_node, "Base Color", settings) == \
+               bakecache.get_bake_key(bsdf_node, "Base Color", settings)
+        assert changed(lambda: setattr(value_node.outputs[0], "default_value", 0.25)), "value node"
+        assert changed(lambda: setattr(ramp_node.color_ramp.elements[0], "position", 0.1)), "color ramp position"
+        assert changed(lambda: setattr(ramp_node.color_ramp.elements[1], "color", (1, 0, 0, 1))), "color ramp color"
+        assert changed(lambda: setattr(ramp_node.color_ramp, "interpolation", "CONSTANT")), "color ramp interpolation"
+        assert changed(lambda: curves_node.mapping.curves[3].points.new(0.5, 0.7)), "RGB curves"
+    finally:
+        bpy.data.materials.remove(mat)
+
+
+TESTS = [
+    test_bake_key_changes,
+    test_smoothness_luts,
+    test_texture_size_index_scaling,
+    test_bake_cache_merge,
+    test_farm_shards,
+]
+
+
+def run_tests():
+    """Runs the tests, logging each result. Returns True if they all passed."""
+    failed = []
+    for test in TESTS:
+        try:
+            test()
+            utils.log_info("PASS " + test.__name__)
+        except Exception as e:
+            utils.log_error("FAIL " + test.__name__ + ": " + repr(e))
+            failed.append(test.__name__)
+    utils.log_info(str(len(TESTS) - len(failed)) + " of " + str(len(TESTS)) + " tests passed.")
+    return not failed
+
+
+def legacy_pack_mask(image, metallic_image, ao_image, mask_image, roughness_image, mapping):
+    """The HDRP mask packing as it was, one pixel at a time over python lists."""
+    metallic_data = metallic_image.pixels[:]
+    ao_data = ao_image.pixels[:]
+    mask_data = mask_image.pixels[:]
+    roughness_data = roughness_image.pixels[:]
+    image_data = list(image.pixels)
+    l = len(image_data)
+
+    for i in range(0, l, 4):
+        image_data[i] = metallic_data[i]
+        image_data[i+1] = ao_data[i]
+        image_data[i+2] = mask_data[i]
+        roughness = roughness_data[i]
+        if mapping == "SIR":
+            smoothness = pow(1 - roughness, 2)
+        elif mapping == "IRS":
+            smoothness = 1 - pow(roughness, 2)
+        elif mapping == "IRSR":
+            smoothness = 1 - pow(roughness, 0.5)
+        elif mapping == "SRIR":
+            smoothness = pow(1 - roughness, 0.5)
+        elif mapping == "SRIRS":
+            smoothness = pow(1 - pow(roughness, 2), 0.5)
+        else: # IR
+            smoothness = 1 - roughness
+        image_data[i+3] = smoothness
+
+    image.pixels[:] = image_data
+    image.update()
+
+
+def run_packing(sizes = (1024, 2048, 4096, 8192), legacy_max_size = 2048, mapping = "SIR"):
+    """Times packing an HDRP mask from four source maps with the per-pixel loop and with the packer,
+    at each size. The per-pixel loop is too slow to run above legacy_max_size, so above that its time is
+    estimated from the largest size it ran at, per pixel. Returns a list of the timings in seconds.
+    """
+    props = bpy.context.scene.CC3BakeProps
+    smoothness_mapping = props.smoothness_mapping
+    smoothness_lut = props.smoothness_lut
+    props.smoothness_mapping = mapping
+    props.smoothness_lut = "NONE"
+    rng = numpy.random.default_rng(0)
+    channel_specs = vars.CHANNEL_PACKS["Mask"][2]
+    results = []
+    legacy_per_pixel = None
+
+    try:
+        for size in sizes:
+            images = []
+            try:
+                source_images = {}
+                for suffix in ("Metallic", "AO", "MicroNormalMask", "Roughness"):
+                    image = bpy.data.images.new(BENCHMARK_PREFIX + suffix, size, size)
+                    images.append(image)
+                    # as 8 bit baked maps
+                    image.pixels.foreach_set((rng.integers(0, 256, size * size * 4) / 255).astype(numpy.float32))
+                    source_images[suffix] = image
+                packed = bpy.data.images.new(BENCHMARK_PREFIX + "packed", size, size, alpha=True, float_buffer=True)
+                images.append(packed)
+
+                start = time.perf_counter()
+                packer.PackJob(packed, channel_specs, source_images, None).run()
+                seconds = time.perf_counter() - start
+                result = { "size": size, "packer": seconds, "legacy": None, "estimated": False, "difference": None }
+
+                if size <= legacy_max_size:
+                    new_data = packer.get_image_pixels(packed)
+                    legacy = bpy.data.images.new(BENCHMARK_PREFIX + "legacy", size, size, alpha=True, float_buffer=True)
+                    images.append(legacy)
+                    start = time.perf_counter()
+                    legacy_pack_mask(legacy, source_images["Metallic"], source_images["AO"],
+                                     source_images["MicroNormalMask"], source_images["Roughness"], mapping)
+                    result["legacy"] = time.perf_counter() - start
+                    legacy_per_pixel = result["legacy"] / (size * size)
+                    result["difference"] = float(numpy.max(numpy.abs(packer.get_image_pixels(legacy) - new_data)))
+                    assert result["difference"] <= 1e-6, result
+                elif legacy_per_pixel is not None:
+                    result["legacy"] = legacy_per_pixel * size * size
+                    result["estimated"] = True
+                results.append(result)
+
+            finally:
+                for image in images:
+                    bpy.data.images.remove(image)
+
+    finally:
+        props.smoothness_mapping = smoothness_mapping
+        props.smoothness_lut = smoothness_lut
+
+    return results
+
+
+def log_packing_results(results):
+    utils.log_info("")
+    utils.log_info("HDRP mask packing benchmark:")
+    utils.log_info("")
+    for result in results:
+        line = f"{result['size']:5d} x {result['size']:<5d} packer {result['packer']:9.3f} s"
+        if result["legacy"] is not None:
+            line += f"  per-pixel {result['legacy']:9.3f} s  x{result['legacy'] / max(result['packer'], 1e-9):7.1f}"
+            line += " (estimated)" if result["estimated"] else f"  max difference {result['difference']:.2e}"
+        utils.log_info(line)
+    utils.log_info("")
+
+
+def legacy_make_new_image(name, size, format, ext, dir, data, alpha):
+    """Makes a new bake image as it was made, saving an empty placeholder file straight away."""
+    img = bpy.data.images.new(name, size, size, alpha=alpha, is_data=data)
+    img.pixels[0] = 0
+    img.file_format = format
+    dir = os.path.join(bpy.path.abspath("//"), dir)
+    os.makedirs(dir, exist_ok=True)
+    img.filepath_raw = os.path.join(dir, name + ext)
+    img.save()
+    return img
+
+
+def run_first_bake(materials = 10, size = 2048):
+    """Times making, filling and saving every bake image of a character's first bake to the current target,
+    for materials materials, with and without the empty placeholder save. Returns the timings in seconds."""
+    props = bpy.context.scene.CC3BakeProps
+    map_suffixes = list(vars.get_bake_target_maps(props.target_mode).keys())
+    folder = tempfile.mkdtemp(prefix=BENCHMARK_PREFIX)
+    rng = numpy.random.default_rng(0)
+    # stands in for the baked pixels
+    baked = rng.random(size * size * 4, dtype=numpy.float32)
+    results = { "images": materials * len(map_suffixes), "placeholder": 0.0, "in_memory": 0.0 }
+
+    try:
+        for name, function in (("placeholder", legacy_make_new_image), ("in_memory", bake.make_new_image)):
+            for m in range(0, materials):
+                for map_suffix in map_suffixes:
+                    image_name = BENCHMARK_PREFIX + name + "_" + str(m) + "_" + map_suffix
+                    start = time.perf_counter()
+                    image = function(image_name, size, "PNG", ".png", os.path.join(folder, name), False, True)
+                    image.pixels.foreach_set(baked)
+                    image.save()
+                    results[name] += time.perf_counter() - start
+                    bake.remove_image(image)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    return results
+
+
+def log_first_bake_results(results, materials, size):
+    utils.log_info("")
+    utils.log_info(f"First bake benchmark, {results['images']} images of {materials} materials at {size} x {size}:")
+    utils.log_info("")
+    utils.log_info(f"with placeholder save {results['placeholder']:9.3f} s")
+    utils.log_info(f"in memory only        {results['in_memory']:9.3f} s")
+    utils.log_info(f"saved                 {results['placeholder'] - results['in_memory']:9.3f} s")
+    utils.log_info("")
+
+
+def log_results(title, results):
+    utils.log_info("")
+    utils.log_info(title)
+    utils.log_info("")
+    for name, seconds in results.items():
+        utils.log_info(f"{name:<26} {seconds * 1000000:12.2f} us")
+    utils.log_info("")
+
+
+def main(count = 10000, characters = 10, materials = 10, size = 2048):
+    log_results("Bake cache benchmark, " + str(count) + " entries:", run(count))
+    if hasattr(bpy.context.scene, "CC3ImportProps"):
+        log_results("CC3 material cache benchmark, " + str(characters) + " characters:",
+                    run_material_cache(characters))
+    else:
+        utils.log_info("No CC3 import add-on, skipping the CC3 material cache benchmark.")
+    log_packing_results(run_packing())
+    log_first_bake_results(run_first_bake(materials, size), materials, size)
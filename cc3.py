@@ -4,43 +4,74 @@ from . import utils
 NODE_PREFIX = "cc3iid_"
 
 
+# the material cache collections of each imported character, in the order they are searched
+MATERIAL_CACHES = [
+    "eye_material_cache", "hair_material_cache", "head_material_cache", "skin_material_cache",
+    "tongue_material_cache", "teeth_material_cache", "tearline_material_cache",
+    "eye_occlusion_material_cache", "pbr_material_cache", "sss_material_cache",
+]
+
+# { material pointer: [character index, collection name, index] }
+# rebuilt when the import props or the number of characters changes, and cleared each bake run,
+# entries that have since been given another material are caught by the check in find_material_cache
+material_cache_index = {}
+material_cache_key = None
+
+
+@bpy.app.handlers.persistent
+def clear_material_cache_index(*args):
+        """Undo and loading files reallocate the materials, so their pointers are no longer valid."""
+        global material_cache_key
+        material_cache_index.clear()
+        material_cache_key = None
+
+
+def get_material_cache_key(props):
+        return [props.as_pointer(), len(props.import_cache)]
+
+
+def build_material_cache_index(props, key):
+        global material_cache_key
+        material_cache_index.clear()
+        for c in range(0, len(props.import_cache)):
+            chr_cache = props.import_cache[c]
+            for name in MATERIAL_CACHES:
+                caches = getattr(chr_cache, name)
+                for i in range(0, len(caches)):
+                    mat = caches[i].material
+                    if mat is not None:
+                        material_cache_index.setdefault(mat.as_pointer(), [c, name, i])
+        material_cache_key = key
+
+
+def find_material_cache(props, mat):
+        entry = material_cache_index.get(mat.as_pointer())
+        if entry:
+            c, name, i = entry
+            # the caches may have shrunk since indexed
+            if c < len(props.import_cache):
+                caches = getattr(props.import_cache[c], name)
+                if i < len(caches) and caches[i].material == mat:
+                    return caches[i]
+        return None
+
+
 def get_material_cache(mat):
         """Returns the material cache for this material.
 
         Fetches the material cache for the material. Returns None if the material is not in the cache.
+        The caches of all the imported characters are indexed by material pointer, so this is a dictionary lookup.
         """
 
         props = bpy.context.scene.CC3ImportProps
         if mat is not None:
-            for chr_cache in props.import_cache:
-                for cache in chr_cache.eye_material_cache:
-                    if cache.material == mat:
-                        return cache
-                for cache in chr_cache.hair_material_cache:
-                    if cache.material == mat:
-                        return cache
-                for cache in chr_cache.head_material_cache:
-                    if cache.material == mat:
-                        return cache
-                for cache in chr_cache.skin_material_cache:
-                    if cache.material == mat:
-                        return cache
-                for cache in chr_cache.tongue_material_cache:
-                    if cache.material == mat:
-                        return cache
-                for cache in chr_cache.teeth_material_cache:
-                    if cache.material == mat:
-                        return cache
-                for cache in chr_cache.tearline_material_cache:
-                    if cache.material == mat:
-                        return cache
-                for cache in chr_cache.eye_occlusion_material_cache:
-                    if cache.material == mat:
-                        return cache
-                for cache in chr_cache.pbr_material_cache:
-                    if cache.material == mat:
-                        return cache
-                for cache in chr_cache.sss_material_cache:
-                    if cache.material == mat:
-                        return cache
-        return None
\ No newline at end of file
+            key = get_material_cache_key(props)
+            if key != material_cache_key:
+                build_material_cache_index(props, key)
+            cache = find_material_cache(props, mat)
+            if cache is None and mat.as_pointer() in material_cache_index:
+                # a cache has been given another material since indexed
+                build_material_cache_index(props, key)
+                cache = find_material_cache(props, mat)
+            return cache
+        return None
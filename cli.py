@@ -0,0 +1,192 @@
+"""Headless batch baking from a job manifest.
+
+With the add-on installed and enabled, run from the command line with:
+
+    blender -b character.blend --python-expr "import <addon>.cli; <addon>.cli.main()" -- --manifest bake.json
+
+where <addon> is the folder name the add-on is installed as.
+
+The manifest is JSON (or TOML, if tomllib or toml is available), either a single job or a list of jobs,
+with any settings outside the jobs list used as the defaults for every job:
+
+    {
+        "target_format": "PNG",
+        "bake_path": "//Bake",
+        "results": "//bake_results.json",
+        "jobs": [
+            { "objects": ["CC_Base_Body"], "target_mode": "UNITY_HDRP", "max_size": 2048 },
+            { "objects": ["CC_Base_Body"], "target_mode": "GLTF" }
+        ]
+    }
+
+Every other setting is the name of a CC3BakeProps property. A job with no objects bakes every
+armature and mesh in the scene.
+"""
+
+import bpy
+import os
+import sys
+import json
+import time
+from . import utils
+from . import bake
+
+try:
+    import tomllib
+except ImportError:
+    try:
+        import toml as tomllib
+    except ImportError:
+        tomllib = None
+
+
+# manifest keys that are not bake settings
+MANIFEST_KEYS = { "jobs", "objects", "results", "save" }
+
+
+def load_manifest(path):
+    """Returns the manifest as a dictionary, from a .toml file or otherwise a .json file."""
+    if path.lower().endswith(".toml"):
+        if tomllib is None:
+            raise Exception("Reading TOML manifests needs tomllib (Python 3.11+) or the toml module: " + path)
+        with open(path, "r", encoding="utf-8") as file:
+            return tomllib.loads(file.read())
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def get_jobs(manifest):
+    """Returns each job in the manifest merged over the manifest's default settings."""
+    defaults = {}
+    for key, value in manifest.items():
+        if key != "jobs":
+            defaults[key] = value
+    jobs = []
+    for job in manifest.get("jobs", [{}]):
+        settings = defaults.copy()
+        settings.update(job)
+        jobs.append(settings)
+    return jobs
+
+
+def apply_settings(settings):
+    props = bpy.context.scene.CC3BakeProps
+    for key, value in settings.items():
+        if key in MANIFEST_KEYS:
+            continue
+        if key not in props.bl_rna.properties:
+            raise Exception("Unknown bake setting: " + key)
+        if props.bl_rna.properties[key].type == "ENUM":
+            # texture sizes are enums of the size as a string
+            value = str(value)
+        setattr(props, key, value)
+
+
+def get_job_objects(settings):
+    names = settings.get("objects")
+    if not names:
+        return [obj for obj in bpy.context.scene.objects if obj.type == "ARMATURE" or
+                (obj.type == "MESH" and (obj.parent is None or obj.parent.type != "ARMATURE"))]
+    objects = []
+    for name in names:
+        obj = bpy.data.objects.get(name)
+        if obj is None:
+            raise Exception("Object not found: " + name)
+        objects.append(obj)
+    return objects
+
+
+def get_map_results():
+    results = []
+    for timing in bake.map_timings:
+        result = timing.copy()
+        image = bpy.data.images.get(timing["image"])
+        result["file"] = bpy.path.abspath(image.filepath) if image and image.filepath else ""
+        results.append(result)
+    return results
+
+
+def run_job(settings):
+    """Runs one job of the manifest and returns its results."""
+    result = {
+        "objects": settings.get("objects", []),
+        "settings": { key: value for key, value in settings.items() if key not in MANIFEST_KEYS },
+        "status": "OK",
+        "error": "",
+        "seconds": 0.0,
+        "maps": [],
+    }
+    start = time.perf_counter()
+    try:
+        apply_settings(settings)
+        objects = get_job_objects(settings)
+        result["objects"] = [obj.name for obj in objects]
+        utils.log_info("Baking job: " + ", ".join(result["objects"]))
+        bake.bake_objects(objects)
+    except Exception as e:
+        utils.log_error("Bake job failed: " + str(e))
+        result["status"] = "FAILED"
+        result["error"] = str(e)
+    result["seconds"] = time.perf_counter() - start
+    result["maps"] = get_map_results()
+    result["encodes"] = bake.image_io["encode"]
+    result["decodes"] = bake.image_io["decode"]
+    bake.clear_map_timings()
+    return result
+
+
+def run(manifest_path, results_path = None):
+    """Runs all the jobs in the manifest and writes the results file. Returns True if every job succeeded."""
+    manifest = load_manifest(manifest_path)
+    results_path = results_path or manifest.get("results") or os.path.splitext(manifest_path)[0] + "_results.json"
+    results_path = bpy.path.abspath(results_path)
+
+    results = {
+        "blend_file": bpy.data.filepath,
+        "manifest": manifest_path,
+        "status": "OK",
+        "seconds": 0.0,
+        "jobs": [],
+    }
+    start = time.perf_counter()
+    for settings in get_jobs(manifest):
+        job_result = run_job(settings)
+        results["jobs"].append(job_result)
+        if job_result["status"] != "OK":
+            results["status"] = "FAILED"
+    results["seconds"] = time.perf_counter() - start
+
+    if manifest.get("save") and results["status"] == "OK":
+        bpy.ops.wm.save_mainfile()
+
+    with open(results_path, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    utils.log_info("Bake results written to: " + results_path)
+
+    return results["status"] == "OK"
+
+
+def get_args(argv):
+    """Returns the --manifest and --results arguments after the blender '--' argument separator."""
+    args = argv[argv.index("--") + 1:] if "--" in argv else []
+    manifest_path = None
+    results_path = None
+    i = 0
+    while i < len(args):
+        if args[i] == "--manifest" and i + 1 < len(args):
+            manifest_path = args[i + 1]
+            i += 1
+        elif args[i] == "--results" and i + 1 < len(args):
+            results_path = args[i + 1]
+            i += 1
+        i += 1
+    return manifest_path, results_path
+
+
+def main():
+    manifest_path, results_path = get_args(sys.argv)
+    if not manifest_path:
+        utils.log_error("No bake manifest: use -- --manifest <file.json|file.toml> [--results <file.json>]")
+        sys.exit(2)
+    if not run(manifest_path, results_path):
+        sys.exit(1)
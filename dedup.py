@@ -0,0 +1,97 @@
+import bpy
+import os
+import hashlib
+from . import utils
+from . import packer
+
+# fingerprint: canonical image
+canonical_images = {}
+# images that have been reused in place of a duplicate
+reused_images = set()
+# canonical image pointer: [canonical image, number of duplicates it replaced]
+duplicate_counts = {}
+maps_saved = 0
+bytes_saved = 0
+
+
+def reset():
+    global maps_saved, bytes_saved
+    canonical_images.clear()
+    reused_images.clear()
+    duplicate_counts.clear()
+    maps_saved = 0
+    bytes_saved = 0
+
+
+def get_fingerprint(image, map_suffix = None):
+    """Returns a hash of the image pixels, size, map and everything that changes how it is saved.
+
+    Only maps of the same kind are shared, as some (i.e. the HDRP thickness) are post processed in place.
+    """
+    hasher = hashlib.blake2b(digest_size=20)
+    settings = [map_suffix, image.size[0], image.size[1], image.channels, image.file_format,
+                image.colorspace_settings.name, image.alpha_mode, getattr(image, "use_half_precision", False)]
+    hasher.update(repr(settings).encode())
+    hasher.update(memoryview(packer.get_image_pixels(image)))
+    return hasher.hexdigest()
+
+
+def get_canonical_image(image, map_suffix = None):
+    """Returns an identical image produced earlier in this bake run, or None if the image is the first of its kind.
+
+    The first image of its kind becomes the canonical image for any later duplicates.
+    """
+    props = bpy.context.scene.CC3BakeProps
+    if not props.dedup_maps or image is None:
+        return None
+
+    fingerprint = get_fingerprint(image, map_suffix)
+    canonical = canonical_images.get(fingerprint)
+    if canonical and canonical != image:
+        try:
+            canonical.name
+        except:
+            # canonical image has been removed
+            canonical = None
+    if canonical and canonical != image:
+        add_saved(canonical)
+        reused_images.add(canonical)
+        utils.log_info("Duplicate map: " + image.name + " reusing: " + canonical.name)
+        return canonical
+
+    canonical_images[fingerprint] = image
+    return None
+
+
+def add_saved(canonical):
+    global maps_saved
+    maps_saved += 1
+    entry = duplicate_counts.get(canonical.as_pointer())
+    if entry is None:
+        entry = [canonical, 0]
+        duplicate_counts[canonical.as_pointer()] = entry
+    entry[1] += 1
+
+
+def measure_saved():
+    """Adds up the file sizes of the duplicates that were not written.
+
+    Called once all the images have been written, as the canonical images are written after they are found.
+    """
+    global bytes_saved
+    bytes_saved = 0
+    for canonical, count in duplicate_counts.values():
+        try:
+            bytes_saved += count * os.path.getsize(bpy.path.abspath(canonical.filepath))
+        except:
+            pass
+
+
+def is_reused(image):
+    return image in reused_images
+
+
+def log_report():
+    props = bpy.context.scene.CC3BakeProps
+    if props.dedup_maps:
+        utils.log_info("Deduplicated maps: " + str(maps_saved) + ", saved: " + str(int(bytes_saved / 1024)) + " KB")
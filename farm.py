@@ -0,0 +1,254 @@
+"""Bakes the materials in parallel across several background Blender worker processes.
+
+The coordinator saves a copy of the blend file next to it (so relative bake paths still resolve),
+splits the materials into shards and launches a background Blender worker for each shard.
+Each worker bakes its shard into the shared bake folder and writes the baked materials to a library blend file.
+The coordinator then appends the baked materials back into this file and swaps them into the
+material slots and the bake cache, as bake_object does.
+"""
+
+import bpy
+import os
+import sys
+import json
+import subprocess
+from . import utils
+from . import vars
+from . import nodeutils
+from . import bake
+
+# the add-on module, for the workers to import
+ADDON_MODULE = __name__.partition(".")[0]
+WORKER_EXPR = "import " + ADDON_MODULE + ".farm as farm; farm.worker_main()"
+
+
+def get_baked_meshes(objects):
+    meshes = []
+    for obj in objects:
+        if obj.type == "MESH":
+            meshes.append(obj)
+        elif obj.type == "ARMATURE":
+            meshes.extend([child for child in obj.children if child.type == "MESH"])
+    return meshes
+
+
+def get_source_materials(objects):
+    """Returns the source materials that bake_object would bake for the objects, in slot order."""
+    materials = []
+    for mesh in get_baked_meshes(objects):
+        for slot in mesh.material_slots:
+            source_mat = slot.material
+            bake_cache = bake.get_bake_cache(source_mat)
+            if bake_cache and bake_cache.source_material is not None:
+                source_mat = bake_cache.source_material
+            if (source_mat and source_mat.node_tree and
+                nodeutils.get_bsdf_node(source_mat.node_tree.nodes) and
+                source_mat not in materials):
+                materials.append(source_mat)
+    return materials
+
+
+def bake_objects(objects, workers, executable = None):
+    """Bakes the materials of the objects across up to workers background Blender processes.
+
+    executable: the Blender executable to run the workers with, defaults to this Blender.
+    """
+
+    materials = get_source_materials(objects)
+    workers = min(workers, len(materials))
+    if not bpy.data.filepath:
+        utils.log_warn("Bake farm needs the blend file to be saved, baking locally.")
+        workers = 1
+    if workers <= 1:
+        bake.bake_objects(objects, [mat.name for mat in materials])
+        return
+
+    bake.clear_map_timings()
+
+    # give out the uids of new materials here, so the workers don't each give out the same ones
+    for mat in materials:
+        if bake.get_bake_cache(mat) is None:
+            bake.add_bake_cache(bake.next_uid(), mat, None)
+
+    farm_path = os.path.join(bake.get_bake_path(), vars.FARM_FOLDER)
+    os.makedirs(farm_path, exist_ok=True)
+    blend_dir, blend_file = os.path.split(bpy.data.filepath)
+    worker_blend = os.path.join(blend_dir, os.path.splitext(blend_file)[0] + vars.FARM_BLEND_SUFFIX)
+    bpy.ops.wm.save_as_mainfile(filepath=worker_blend, copy=True)
+
+    utils.log_info("Baking " + str(len(materials)) + " materials on " + str(workers) + " workers...")
+
+    object_names = [obj.name for obj in objects]
+    shards = []
+    for i in range(0, workers):
+        shard_path = os.path.join(farm_path, "shard_" + str(i))
+        job = {
+            "objects": object_names,
+            "materials": [mat.name for mat in materials[i::workers]],
+            "library": shard_path + ".blend",
+            "result": shard_path + "_result.json",
+        }
+        job_path = shard_path + ".json"
+        with open(job_path, "w", encoding="utf-8") as file:
+            json.dump(job, file, indent=1)
+        command = [executable or bpy.app.binary_path, "-b", worker_blend,
+                   "--python-expr", WORKER_EXPR, "--", "--farm-job", job_path]
+        shards.append([subprocess.Popen(command), job])
+
+    failed = []
+    meshes = set(get_baked_meshes(objects))
+    users = bake.build_material_users(bpy.context.scene.objects)
+    for i in range(0, len(shards)):
+        process, job = shards[i]
+        code = process.wait()
+        result = None
+        try:
+            with open(job["result"], "r", encoding="utf-8") as file:
+                result = json.load(file)
+        except:
+            pass
+        if code != 0 or result is None or result.get("status") != "OK":
+            error = result.get("error", "") if result else "no result"
+            utils.log_error("Bake worker " + str(i) + " failed (" + str(code) + "): " + error)
+            failed.append(i)
+            continue
+        merge_results(meshes, users, job, result)
+
+    try:
+        os.remove(worker_blend)
+    except:
+        pass
+
+    if failed:
+        raise Exception("Bake farm shards failed: " + ", ".join([str(i) for i in failed]))
+
+
+def merge_results(meshes, users, job, result):
+    """Appends the baked materials of a shard and swaps them in for the source and old baked materials.
+
+    users: the material users index of the scene, from bake.build_material_users()
+    """
+    entries = result["materials"]
+    bake.map_timings.extend(result.get("maps", []))
+    if not entries:
+        return
+
+    # index the existing images and node groups, to reuse instead of the appended copies
+    existing_images = {}
+    for image in bpy.data.images:
+        if image.filepath:
+            existing_images[bake.normalize_path(image.filepath)] = image
+    existing_groups = { group.name: group for group in bpy.data.node_groups }
+
+    names = [entry["baked"] for entry in entries]
+    with bpy.data.libraries.load(job["library"], link=False) as (data_from, data_to):
+        found = [name for name in data_from.materials if name in names]
+        data_to.materials = found
+    # the appended materials are in the order asked for, but may have been renamed
+    appended = {}
+    for name, mat in zip(found, data_to.materials):
+        if mat:
+            appended[name] = mat
+
+    for entry in entries:
+        source_mat = bpy.data.materials.get(entry["source"])
+        bake_mat = appended.get(entry["baked"])
+        if source_mat is None or bake_mat is None:
+            utils.log_error("Unable to merge baked material: " + entry["baked"])
+            continue
+
+        remap_appended_data(bake_mat, existing_images, existing_groups)
+
+        bake_cache = bake.get_bake_cache(source_mat)
+        old_mat = bake_cache.baked_material if bake_cache else None
+        if old_mat is None:
+            old_mat = bpy.data.materials.get(entry["baked"])
+            if old_mat == bake_mat:
+                old_mat = None
+
+        # replace all of the old baked materials with the new one:
+        if old_mat:
+            bake.set_material_users(users, old_mat, bake_mat)
+            users.pop(old_mat.as_pointer(), None)
+            bpy.data.materials.remove(old_mat)
+
+        # and the source material in the baked objects
+        bake.set_material_users(users, source_mat, bake_mat, objects = meshes)
+
+        bake_mat.name = entry["baked"]
+        bake_mat.use_fake_user = False
+        bake.add_bake_cache(entry["uid"], source_mat, bake_mat)
+        utils.log_info("Merged baked material: " + bake_mat.name)
+
+
+def remap_appended_data(mat, existing_images, existing_groups):
+    """Points the appended material at the images and node groups already in this file."""
+    for node in mat.node_tree.nodes:
+        if node.type == "TEX_IMAGE" and node.image and node.image.filepath:
+            existing = existing_images.get(bake.normalize_path(node.image.filepath))
+            if existing and existing != node.image:
+                appended = node.image
+                node.image = existing
+                # the worker has just written the file
+                existing.reload()
+                if appended.users == 0:
+                    bpy.data.images.remove(appended)
+        elif node.type == "GROUP" and node.node_tree:
+            existing = existing_groups.get(utils.strip_name(node.node_tree.name))
+            if existing and existing != node.node_tree and node.node_tree.name not in existing_groups:
+                appended = node.node_tree
+                node.node_tree = existing
+                if appended.users == 0:
+                    bpy.data.node_groups.remove(appended)
+
+
+def get_job_path(argv):
+    args = argv[argv.index("--") + 1:] if "--" in argv else []
+    if "--farm-job" in args:
+        i = args.index("--farm-job")
+        if i + 1 < len(args):
+            return args[i + 1]
+    return None
+
+
+def worker_main():
+    """Bakes the shard of materials in the farm job file, run in a background Blender worker."""
+    job_path = get_job_path(sys.argv)
+    if not job_path:
+        utils.log_error("No bake farm job: use -- --farm-job <file.json>")
+        sys.exit(2)
+
+    with open(job_path, "r", encoding="utf-8") as file:
+        job = json.load(file)
+
+    result = { "status": "OK", "error": "", "materials": [], "maps": [] }
+    try:
+        props = bpy.context.scene.CC3BakeProps
+        # bake here, not on another farm
+        props.farm_workers = 1
+        objects = [bpy.data.objects[name] for name in job["objects"]]
+        bake.bake_objects(objects, job["materials"])
+
+        baked = set()
+        for name in job["materials"]:
+            bake_cache = bake.get_bake_cache(bpy.data.materials.get(name))
+            if bake_cache and bake_cache.baked_material:
+                baked.add(bake_cache.baked_material)
+                result["materials"].append({
+                    "source": name,
+                    "baked": bake_cache.baked_material.name,
+                    "uid": bake_cache.uid,
+                })
+        bpy.data.libraries.write(job["library"], baked, path_remap="ABSOLUTE", fake_user=True)
+        result["maps"] = bake.map_timings
+
+    except Exception as e:
+        utils.log_error("Bake worker failed: " + str(e))
+        result["status"] = "FAILED"
+        result["error"] = str(e)
+
+    with open(job["result"], "w", encoding="utf-8") as file:
+        json.dump(result, file, indent=1)
+
+    if result["status"] != "OK":
+        sys.exit(1)
@@ -1,9 +1,121 @@
+import re
 import bpy
 from . import utils, vars
 
 NODE_PREFIX = "cc3iid_"
+# the texture ids in the node names, i.e. the NORMAL of "(NORMAL)"
+TEXTURE_ID_PATTERN = re.compile(r"\(([^()]*)\)")
+
+
+class NodeIndex:
+    """The nodes of a node tree, grouped for the finders below, which all accept it in place of the nodes.
+
+    Groups the nodes by type, maps the texture ids of the cc3iid_ image nodes, i.e. (NORMAL) or (AO),
+    to their nodes and records the shader node. Get it with get_node_index(nodes).
+    It rebuilds itself when nodes have been added or removed other than by make_shader_node or remove_node,
+    which keep it up to date. The names are those when indexed, the finders check them again before returning.
+    """
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.build()
+
+    def build(self):
+        self.key = get_node_index_key(self.nodes)
+        self.by_type = {}
+        self.prefixed = []
+        self.textures = {}
+        self.shader = None
+        for node in self.nodes:
+            self.index_node(node)
+        return self
+
+    def index_node(self, node):
+        self.by_type.setdefault(node.type, []).append(node)
+        if NODE_PREFIX in node.name:
+            self.prefixed.append(node)
+            if node.type == "TEX_IMAGE":
+                for texture_id in TEXTURE_ID_PATTERN.findall(node.name):
+                    self.textures.setdefault(texture_id, node)
+        if self.shader is None and is_shader_node(node):
+            self.shader = node
+
+    def is_current(self):
+        return self.key == get_node_index_key(self.nodes)
+
+    def current(self):
+        if not self.is_current():
+            self.build()
+        return self
+
+    def add(self, node):
+        self.index_node(node)
+        self.key = get_node_index_key(self.nodes)
+
+    def remove(self, node):
+        if node in self.prefixed or node == self.shader:
+            # the next node with the same texture id or shader name takes its place, so index again
+            self.key = None
+        else:
+            typed = self.by_type.get(node.type)
+            if typed and node in typed:
+                typed.remove(node)
+
+    def first(self, type):
+        typed = self.by_type.get(type)
+        return typed[0] if typed else None
+
+
+# node tree pointer: NodeIndex
+node_indexes = {}
+
+
+def get_node_index_key(nodes):
+    """Changes whenever nodes are added or removed: the count and the last node, which a new node always is."""
+    count = len(nodes)
+    if count == 0:
+        return (0, 0, "")
+    last = nodes[count - 1]
+    return (count, last.as_pointer(), last.name)
+
+
+def get_node_index(nodes):
+    """Returns the NodeIndex of the nodes, built once per node tree and rebuilt when nodes are added or removed."""
+    pointer = nodes.id_data.as_pointer()
+    index = node_indexes.get(pointer)
+    if index is None:
+        index = NodeIndex(nodes)
+        node_indexes[pointer] = index
+        return index
+    index.nodes = nodes
+    return index.current()
+
+
+def get_current_node_index(nodes):
+    """Returns the NodeIndex of the nodes only if it is already built and up to date."""
+    index = node_indexes.get(nodes.id_data.as_pointer())
+    if index:
+        index.nodes = nodes
+        if index.is_current():
+            return index
+    return None
+
+
+@bpy.app.handlers.persistent
+def clear_node_indexes(*args):
+    node_indexes.clear()
+
+
+def is_shader_node(n):
+    if n.type == "GROUP" and "(rl_" in n.name and "_shader)" in n.name and n.node_tree:
+        name = n.node_tree.name
+        return NODE_PREFIX in name and "_rl_" in name and "_shader_" in name
+    return False
+
 
 def get_bsdf_node(nodes):
+    if isinstance(nodes, NodeIndex):
+        return nodes.current().first("BSDF_PRINCIPLED")
     for n in nodes:
         if n.type == "BSDF_PRINCIPLED":
             return n
@@ -11,11 +123,14 @@ def get_bsdf_node(nodes):
 
 
 def get_shader_node(nodes):
+    if isinstance(nodes, NodeIndex):
+        index = nodes.current()
+        if index.shader and not is_shader_node(index.shader):
+            index.build()
+        return index.shader
     for n in nodes:
-        if n.type == "GROUP" and "(rl_" in n.name and "_shader)" in n.name:
-            name = n.node_tree.name
-            if NODE_PREFIX in name and "_rl_" in name and "_shader_" in name:
-                return n
+        if is_shader_node(n):
+            return n
     return None
 
 
@@ -72,6 +187,8 @@ def get_node_connected_to_input(node, socket):
 
 def get_node_by_id(nodes, id):
     id = NODE_PREFIX + id
+    if isinstance(nodes, NodeIndex):
+        nodes = nodes.current().prefixed
     for node in nodes:
         if id in node.name:
             return node
@@ -88,6 +205,8 @@ def get_default_shader_input(mat, input):
 
 
 def find_node_by_keywords(nodes, *keywords):
+    if isinstance(nodes, NodeIndex):
+        nodes = nodes.current().prefixed if NODE_PREFIX in keywords else nodes.nodes
     for node in nodes:
         match = True
         for keyword in keywords:
@@ -98,6 +217,8 @@ def find_node_by_keywords(nodes, *keywords):
     return None
 
 def find_node_by_type(nodes, type):
+    if isinstance(nodes, NodeIndex):
+        return nodes.current().first(type)
     for n in nodes:
         if n.type == type:
             return n
@@ -153,9 +274,21 @@ def unlink_node(links, node, socket):
 
 
 def make_shader_node(nodes, type):
+    index = get_current_node_index(nodes)
     shader_node = nodes.new(type)
+    if index:
+        index.add(shader_node)
     return shader_node
 
+
+def remove_node(nodes, node):
+    index = get_current_node_index(nodes)
+    if index:
+        index.remove(node)
+    nodes.remove(node)
+    if index and index.key is not None:
+        index.key = get_node_index_key(nodes)
+
 def make_mixrgb_node(nodes, blend_type):
     mix_node = make_shader_node(nodes, "ShaderNodeMixRGB")
     mix_node.blend_type = blend_type
@@ -177,6 +310,8 @@ def make_node_group_node(nodes, group, label, name):
     return group_node
 
 def find_image_node(nodes, name_search, file_search):
+    if isinstance(nodes, NodeIndex):
+        nodes = nodes.current().by_type.get("TEX_IMAGE", [])
     for node in nodes:
         if node.type == "TEX_IMAGE":
             if name_search == "" and file_search != "" and file_search in node.image.filepath:
@@ -189,6 +324,12 @@ def find_image_node(nodes, name_search, file_search):
 
 def find_shader_texture(nodes, texture_type):
     id = "(" + texture_type + ")"
+    if isinstance(nodes, NodeIndex):
+        index = nodes.current()
+        node = index.textures.get(texture_type)
+        if node and (NODE_PREFIX not in node.name or id not in node.name):
+            node = index.build().textures.get(texture_type)
+        return node
     for node in nodes:
         if node.type == "TEX_IMAGE" and NODE_PREFIX in node.name and id in node.name:
             return node
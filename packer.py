@@ -0,0 +1,311 @@
+import bpy
+import numpy
+from concurrent.futures import ThreadPoolExecutor
+from . import utils
+from . import nodeutils
+
+
+def get_image_pixels(image, size = None, buffer = None):
+    """Returns the image pixels as a flat float32 numpy array.
+
+    image.pixels fetches the entire buffer anew on every access and boxes every float,
+    foreach_get copies it once straight into the numpy buffer.
+    If a buffer of the right length is given, the pixels are read into it instead of a new array.
+    If a size is given and the image is a different size, the pixels are read and then scaled to that size.
+    """
+
+    if size is not None and (image.size[0] != size or image.size[1] != size):
+        utils.log_info("Scaling pack source: " + image.name + " to: " + str(size))
+        return get_scaled_pixels(get_image_pixels(image), image.size[0], image.size[1], image.channels, size)
+
+    length = image.size[0] * image.size[1] * image.channels
+    if buffer is None or len(buffer) != length:
+        buffer = numpy.empty(length, dtype=numpy.float32)
+    image.pixels.foreach_get(buffer)
+    return buffer
+
+
+def get_scaled_pixels(data, width, height, channels, size):
+    """Returns the flat pixels scaled to size x size, with Blender's image scaling on a temporary float image.
+
+    Scales the pixels themselves, not a copy of the image datablock, which would reload the
+    image file or come back blank for an image that so far only exists in memory.
+    """
+
+    rgba = numpy.empty(width * height * 4, dtype=numpy.float32)
+    src = data.reshape(-1, channels)
+    dst = rgba.reshape(-1, 4)
+    for i in range(0, 3):
+        dst[:, i] = src[:, min(i, channels - 1)]
+    dst[:, 3] = src[:, 3] if channels > 3 else 1.0
+
+    temp = bpy.data.images.new("cc3_bake_scale", width, height, alpha=True, float_buffer=True, is_data=True)
+    try:
+        temp.pixels.foreach_set(rgba)
+        temp.scale(size, size)
+        rgba = numpy.empty(size * size * 4, dtype=numpy.float32)
+        temp.pixels.foreach_get(rgba)
+    finally:
+        bpy.data.images.remove(temp)
+
+    if channels == 4:
+        return rgba
+    return numpy.ascontiguousarray(rgba.reshape(-1, 4)[:, :channels]).ravel()
+
+
+def set_image_pixels(image, data):
+    """Replaces the image pixels in-place in one go."""
+    image.pixels.foreach_set(numpy.ravel(data))
+    image.update()
+
+
+def split_channel(src, src_channels, src_index, dst_channels):
+    """Returns the flat greyscale pixels of one channel of the flat src pixels, with an opaque alpha.
+
+    This is the image that baking the value of that channel on its own would produce.
+    """
+
+    pixels = len(src) // src_channels
+    dst = numpy.empty(pixels * dst_channels, dtype=numpy.float32)
+    src_view = src[src_index::src_channels]
+    for i in range(0, min(dst_channels, 3)):
+        dst[i::dst_channels] = src_view
+    if dst_channels > 3:
+        dst[3::dst_channels] = 1.0
+    return dst
+
+
+def is_converged(first, second, tolerance):
+    """Returns True if no value of the two flat pixel arrays differs by more than tolerance."""
+    if len(first) != len(second):
+        return False
+    if len(first) == 0:
+        return True
+    return float(numpy.max(numpy.abs(first - second))) <= tolerance
+
+
+def get_constant_value(image, tolerance):
+    """Returns the RGBA value of the image if every pixel is the same value within tolerance, otherwise None."""
+    if image.size[0] == 0 or image.size[1] == 0:
+        return None
+    data = get_image_pixels(image).reshape(-1, image.channels)
+    lo = data.min(axis=0)
+    hi = data.max(axis=0)
+    if numpy.all(hi - lo <= tolerance):
+        value = [float(v) for v in (lo + hi) * 0.5]
+        while len(value) < 4:
+            value.append(value[-1] if len(value) < 3 else 1.0)
+        return value
+    return None
+
+
+def copy_channel(dst, dst_channels, dst_index, src, src_channels, src_index, transfer, band_pixels):
+    """Copies one channel of the flat src pixels into one channel of the flat dst pixels.
+
+    Any transfer function is applied in bands of band_pixels, so its temporary arrays stay
+    the size of a band and not the size of the image.
+    """
+
+    src_index = min(src_index, src_channels - 1)
+    dst_view = dst[dst_index::dst_channels]
+    src_view = src[src_index::src_channels]
+    if transfer is None:
+        dst_view[:] = src_view
+    else:
+        for start in range(0, len(dst_view), band_pixels):
+            end = start + band_pixels
+            dst_view[start:end] = transfer(src_view[start:end])
+
+
+# roughness to smoothness functions, keyed as vars.CONVERSION_FUNCTIONS,
+# these work on both python floats and double precision arrays.
+SMOOTHNESS_FUNCTIONS = {
+    "IR": lambda r: 1 - r,
+    "SIR": lambda r: numpy.power(1 - r, 2),
+    "IRS": lambda r: 1 - numpy.power(r, 2),
+    "IRSR": lambda r: 1 - numpy.power(r, 0.5),
+    "SRIR": lambda r: numpy.power(1 - r, 0.5),
+    "SRIRS": lambda r: numpy.power(1 - numpy.power(r, 2), 0.5),
+}
+
+
+def get_smoothness_function(mapping, lut_bits = 0):
+    """Returns a vectorized roughness to smoothness function for the vars.CONVERSION_FUNCTIONS mapping.
+
+    Arrays are converted in double precision (as the python floats were) and returned as float32.
+    If lut_bits is set, arrays are quantized to that many bits and converted with a lookup table instead.
+    """
+
+    function = SMOOTHNESS_FUNCTIONS.get(mapping, SMOOTHNESS_FUNCTIONS["IR"])
+
+    if lut_bits:
+        return make_lut_function(function, lut_bits)
+
+    def smoothness(value):
+        if isinstance(value, numpy.ndarray):
+            return function(value.astype(numpy.float64)).astype(numpy.float32)
+        return float(function(value))
+
+    return smoothness
+
+
+def make_lut_function(function, bits):
+    """Returns a vectorized function that looks up the results of function from a table of 2^bits levels.
+
+    Only suitable for inputs quantized to that many bits, i.e. from 8 bit or 16 bit PNG or JPEG textures.
+    """
+
+    levels = (1 << bits) - 1
+    lut = function(numpy.arange(0, levels + 1, dtype=numpy.float64) / levels).astype(numpy.float32)
+    index_type = numpy.uint8 if bits <= 8 else numpy.uint16 if bits <= 16 else numpy.uint32
+
+    def lut_function(value):
+        if isinstance(value, numpy.ndarray):
+            index = numpy.rint(numpy.clip(value, 0, 1) * levels).astype(index_type)
+            return numpy.take(lut, index)
+        return float(function(value))
+
+    return lut_function
+
+
+def smoothness_transfer():
+    props = bpy.context.scene.CC3BakeProps
+    lut_bits = 0
+    if props.smoothness_lut == "LUT8":
+        lut_bits = 8
+    elif props.smoothness_lut == "LUT16":
+        lut_bits = 16
+    return get_smoothness_function(props.smoothness_mapping, lut_bits)
+
+
+def invert_value(value):
+    return 1.0 - value
+
+
+def invert_transfer():
+    return invert_value
+
+
+# transfer functions for the vars.CHANNEL_PACKS channels,
+# each returns the function to apply, chosen once per packed image.
+TRANSFER_FUNCTIONS = {
+    "SMOOTHNESS": smoothness_transfer,
+    "INVERT": invert_transfer,
+}
+
+
+def get_channel_fallback(bsdf_node, input, channel, default):
+    if input is None:
+        return default
+    value = nodeutils.get_node_input(bsdf_node, input, default)
+    try:
+        return value[channel]
+    except:
+        return value
+
+
+class PackJob:
+    """A packed image to build from a vars.CHANNEL_PACKS channel list.
+
+    Everything that needs bpy (the fallback values, the transfer functions and the image pixels)
+    is fetched on the main thread, compute() only works on numpy arrays and can run on any thread.
+    """
+
+    def __init__(self, image, channel_specs, source_images, bsdf_node, band_rows = 256):
+        self.image = image
+        self.size = image.size[0]
+        self.pixels = image.size[0] * image.size[1]
+        self.channels = image.channels
+        self.band_pixels = max(1, band_rows) * image.size[0]
+        self.keep = False
+        self.constants = []
+        self.copies = []
+        self.source_images = {}
+
+        transfer_functions = {}
+        for i in range(0, min(len(channel_specs), self.channels)):
+            spec = channel_specs[i]
+            if spec is None:
+                # keep the existing channel values
+                self.keep = True
+                continue
+            source_suffix, source_channel, fallback_input, fallback_value, transfer = spec
+            transfer_function = None
+            if transfer:
+                if transfer not in transfer_functions:
+                    transfer_functions[transfer] = TRANSFER_FUNCTIONS[transfer]()
+                transfer_function = transfer_functions[transfer]
+            source_image = source_images.get(source_suffix) if source_suffix else None
+            if source_image:
+                self.source_images[source_suffix] = source_image
+                self.copies.append([i, source_suffix, source_channel, transfer_function])
+            else:
+                value = get_channel_fallback(bsdf_node, fallback_input, source_channel, fallback_value)
+                if transfer_function:
+                    value = transfer_function(value)
+                self.constants.append([i, value])
+
+    def read_target(self):
+        """Returns the existing pixels of the packed image, if any of its channels are kept."""
+        if self.keep:
+            return get_image_pixels(self.image)
+        return None
+
+    def stream_sources(self):
+        """Yields each source's pixels in turn through a single scratch buffer."""
+        scratch = None
+        for source_suffix, source_image in self.source_images.items():
+            scratch = get_image_pixels(source_image, self.size, scratch)
+            yield source_suffix, scratch
+
+    def read_sources(self):
+        """Returns a list of each source's pixels, as raw buffers to compute() from any thread."""
+        return [[source_suffix, get_image_pixels(source_image, self.size)]
+                for source_suffix, source_image in self.source_images.items()]
+
+    def compute(self, image_data, sources):
+        """Returns the packed pixels from the target pixels (or None) and the (suffix, pixels) sources."""
+        if image_data is None:
+            image_data = numpy.empty(self.pixels * self.channels, dtype=numpy.float32)
+        for i, value in self.constants:
+            image_data[i::self.channels] = value
+        for source_suffix, source_data in sources:
+            source_channels = len(source_data) // self.pixels
+            for i, suffix, source_channel, transfer in self.copies:
+                if suffix == source_suffix:
+                    copy_channel(image_data, self.channels, i, source_data, source_channels,
+                                 source_channel, transfer, self.band_pixels)
+        return image_data
+
+    def write(self, image_data):
+        """Sets the packed pixels, the image is left for the caller to save."""
+        set_image_pixels(self.image, image_data)
+        utils.log_peak_memory("Packed: " + self.image.name)
+
+    def run(self):
+        """Packs the image serially on the main thread."""
+        self.write(self.compute(self.read_target(), self.stream_sources()))
+
+
+def run_pack_jobs(jobs, threads = 1):
+    """Runs all the pack jobs, computing up to threads jobs at a time on a thread pool.
+
+    The image pixels are read and written on the main thread, numpy releases the GIL
+    while computing so the packing itself runs in parallel.
+    The results are identical to running each job serially.
+    """
+
+    if threads <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            job.run()
+        return
+
+    utils.log_info("Packing " + str(len(jobs)) + " textures on " + str(threads) + " threads...")
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for start in range(0, len(jobs), threads):
+            batch = jobs[start:start + threads]
+            futures = []
+            for job in batch:
+                futures.append(executor.submit(job.compute, job.read_target(), job.read_sources()))
+            for job, future in zip(batch, futures):
+                job.write(future.result())
@@ -0,0 +1,148 @@
+import os
+import csv
+import json
+import time
+import threading
+import contextlib
+from . import utils
+
+# the bake is profiled only while enabled, otherwise spans cost next to nothing
+enabled = False
+start_time = 0
+# completed spans: { "name", "cat", "start", "duration", "depth", "tid", "args" }
+spans = []
+# the open spans, innermost last
+stack = []
+# the summary of the last profiled bake: [[category, name, count, total seconds, max seconds, bytes]]
+summary = []
+
+
+def start():
+    """Starts profiling, returns False if a profile is already running (the caller should then not stop it)."""
+    global enabled, start_time
+    if enabled:
+        return False
+    enabled = True
+    start_time = time.perf_counter()
+    spans.clear()
+    stack.clear()
+    return True
+
+
+def stop():
+    global enabled
+    enabled = False
+    stack.clear()
+    build_summary()
+
+
+@contextlib.contextmanager
+def span(name, category = "stage", **args):
+    """Times the enclosed code as a span nested inside any open span.
+
+    args are recorded with the span, i.e. the material, map, image size or bytes written.
+    """
+    if not enabled:
+        yield None
+        return
+    record = {
+        "name": name,
+        "cat": category,
+        "start": time.perf_counter(),
+        "duration": 0.0,
+        "depth": len(stack),
+        "tid": threading.get_ident(),
+        "args": args,
+    }
+    stack.append(record)
+    try:
+        yield record
+    finally:
+        record["duration"] = time.perf_counter() - record["start"]
+        if stack and stack[-1] is record:
+            stack.pop()
+        spans.append(record)
+
+
+def add_args(**args):
+    """Adds args to the innermost open span."""
+    if enabled and stack:
+        stack[-1]["args"].update(args)
+
+
+def get_file_size(path):
+    try:
+        return os.path.getsize(path)
+    except:
+        return 0
+
+
+def build_summary():
+    """Totals the spans by category and name, largest total first."""
+    totals = {}
+    for record in spans:
+        key = (record["cat"], record["name"])
+        total = totals.get(key)
+        if total is None:
+            total = [record["cat"], record["name"], 0, 0.0, 0.0, 0]
+            totals[key] = total
+        total[2] += 1
+        total[3] += record["duration"]
+        total[4] = max(total[4], record["duration"])
+        total[5] += record["args"].get("bytes", 0)
+    summary.clear()
+    summary.extend(sorted(totals.values(), key=lambda t: t[3], reverse=True))
+
+
+def log_summary():
+    utils.log_info("")
+    utils.log_info("Bake Profile:")
+    utils.log_info("")
+    for category, name, count, total, longest, written in summary:
+        line = f"{category:>8} {name:<24} x{count:<5} {total:10.3f}s  max {longest:8.3f}s"
+        if written:
+            line += f"  {written / (1024 * 1024):8.1f} MB"
+        utils.log_info(line)
+    utils.log_info("")
+
+
+def write_chrome_trace(path):
+    """Writes the spans as Chrome trace events, for chrome://tracing or ui.perfetto.dev"""
+    events = []
+    pid = os.getpid()
+    for record in spans:
+        events.append({
+            "name": record["name"],
+            "cat": record["cat"],
+            "ph": "X",
+            "ts": (record["start"] - start_time) * 1000000,
+            "dur": record["duration"] * 1000000,
+            "pid": pid,
+            "tid": record["tid"],
+            "args": record["args"],
+        })
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump({ "traceEvents": events, "displayTimeUnit": "ms" }, file)
+
+
+def write_csv(path):
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(["category", "name", "depth", "start_ms", "duration_ms", "material", "map", "size", "bytes"])
+        for record in sorted(spans, key=lambda r: r["start"]):
+            args = record["args"]
+            writer.writerow([record["cat"], record["name"], record["depth"],
+                             round((record["start"] - start_time) * 1000, 3),
+                             round(record["duration"] * 1000, 3),
+                             args.get("material", ""), args.get("map", ""),
+                             args.get("size", ""), args.get("bytes", "")])
+
+
+def write_reports(folder, trace_file, csv_file):
+    try:
+        os.makedirs(folder, exist_ok=True)
+        write_chrome_trace(os.path.join(folder, trace_file))
+        write_csv(os.path.join(folder, csv_file))
+        utils.log_info("Bake profile written to: " + folder)
+    except Exception as e:
+        utils.log_warn("Unable to write bake profile: " + str(e))
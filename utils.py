@@ -1,4 +1,5 @@
 import bpy
+import sys
 import time
 
 timer = 0
@@ -45,6 +46,47 @@ def log_timer(msg, unit = "s"):
     print(msg + ": " + str(duration) + " " + unit)
 
 
+def get_peak_memory():
+    """Returns the peak resident memory of this process in bytes, or 0 if it can't be determined."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS reports bytes, linux reports kilobytes
+        if sys.platform == "darwin":
+            return peak
+        return peak * 1024
+    except:
+        pass
+    try:
+        import ctypes
+        import ctypes.wintypes
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", ctypes.wintypes.DWORD),
+                        ("PageFaultCount", ctypes.wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t),
+                        ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t),
+                        ("PeakPagefileUsage", ctypes.c_size_t)]
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(PROCESS_MEMORY_COUNTERS)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize
+    except:
+        pass
+    return 0
+
+
+def log_peak_memory(msg):
+    peak = get_peak_memory()
+    if peak:
+        log_info(msg + ": peak memory: " + str(int(peak / (1024 * 1024))) + " MB")
+
+
 # remove any .001 from the material name
 def strip_name(name):
     if name[-3:].isdigit() and name[-4] == ".":
@@ -131,11 +173,36 @@ def rest_pose(rig):
     return False
 
 
-def remove_collection(coll, item):
+def get_collection_index(coll, item):
+    """Returns the index of the item in the collection, read from the end of its data path, i.e. "bake_cache[12]".
+
+    Falls back to searching the collection if the path has no index. Returns -1 if not found.
+    """
+    try:
+        path = item.path_from_id()
+        if path.endswith("]"):
+            i = int(path[path.rindex("[") + 1:-1])
+            if i < len(coll) and coll[i] == item:
+                return i
+    except:
+        pass
     for i in range(0, len(coll)):
         if coll[i] == item:
-            coll.remove(i)
-            return
+            return i
+    return -1
+
+
+def copy_property_group(src, dst):
+    """Copies every writable property of the src property group to dst."""
+    for prop in src.bl_rna.properties:
+        if prop.identifier != "rna_type" and not prop.is_readonly:
+            setattr(dst, prop.identifier, getattr(src, prop.identifier))
+
+
+def remove_collection(coll, item):
+    i = get_collection_index(coll, item)
+    if i >= 0:
+        coll.remove(i)
 
 def get_tex_image_size(node):
     if node is not None:
@@ -34,6 +34,52 @@ CONVERSION_FUNCTIONS = [
     ("SRIRS","sqrt(1 - R^2)","Square Root of Inverted Roughness Squared"),
 ]
 
+LUT_MODES = [
+    ("NONE","None", "Calculate the smoothness of every pixel exactly"),
+    ("LUT8","8 Bit", "Use an 8 bit lookup table. Accurate for roughness from 8 bit PNG or JPEG textures"),
+    ("LUT16","16 Bit", "Use a 16 bit lookup table. Accurate for roughness from 16 bit PNG textures"),
+]
+
+CONSTANT_MAP_MODES = [
+    ("FULL","Full Size", "Keep constant maps at full size"),
+    ("TINY","Tiny Texture", "Shrink maps that are a single value over the whole texture to a tiny texture"),
+    ("VALUE","Shader Value", "Shrink constant maps to a tiny texture and use the value directly in the shader where possible"),
+]
+
+CONSTANT_MAP_SIZE = 1
+# half of an 8 bit step
+CONSTANT_MAP_TOLERANCE = 0.5 / 255
+CONSTANT_MAP_PROP = "cc3_bake_constant"
+
+# nodes that vary within a pixel or from sample to sample, so anything baked through them needs the full bake samples
+SAMPLED_NODE_TYPES = {
+    "AMBIENT_OCCLUSION", "BEVEL", "BUMP", "LIGHT_PATH", "WIREFRAME", "SCRIPT",
+    "TEX_NOISE", "TEX_VORONOI", "TEX_MUSGRAVE", "TEX_WAVE", "TEX_MAGIC", "TEX_BRICK",
+    "TEX_CHECKER", "TEX_WHITE_NOISE", "TEX_POINTDENSITY", "TEX_ENVIRONMENT", "TEX_SKY",
+}
+# math operations that put hard steps into smooth texture values, i.e. the color ID masks of the mixers
+SAMPLED_MATH_OPERATIONS = {
+    "COMPARE", "GREATER_THAN", "LESS_THAN", "SIGN", "ROUND", "FLOOR", "CEIL", "TRUNC",
+    "FRACT", "MODULO", "FLOORED_MODULO", "WRAP", "SNAP", "PINGPONG",
+}
+# texture coordinates an image texture can be read through and still converge in a single sample
+UV_NODE_TYPES = { "TEX_COORD", "UVMAP" }
+# the most two bakes can differ by and be converged, half of an 8 bit step
+CONVERGENCE_TOLERANCE = 0.5 / 255
+
+BAKE_CACHE_FILE = "cc3_bake_cache.json"
+# seconds before a lock on the bake cache file left by a crashed process is broken
+BAKE_CACHE_LOCK_TIMEOUT = 30
+# bake profile reports, in the bake folder
+PROFILE_TRACE_FILE = "cc3_bake_profile.json"
+PROFILE_CSV_FILE = "cc3_bake_profile.csv"
+# the most memory the raw bakes of a multi-target bake are kept in, a 4K RGBA raw bake takes 256 MB
+RAW_MAP_MEMORY_LIMIT = 4096 * 1024 * 1024
+# bake farm job files, in the bake folder
+FARM_FOLDER = "cc3_bake_farm"
+# the copy of the blend file the bake farm workers open, next to the blend file
+FARM_BLEND_SUFFIX = "_cc3_bake_farm.blend"
+
 def get_bake_target_maps(target):
     if target == "SKETCHFAB":
         return SKETCHFAB_MAPS
@@ -158,6 +204,69 @@ UNITY_HDRP_MAPS = {
 }
 
 
+def get_bake_target_packs(target):
+    if target == "GLTF":
+        return GLTF_PACKS
+    elif target == "UNITY_URP":
+        return UNITY_URP_PACKS
+    elif target == "UNITY_HDRP":
+        return UNITY_HDRP_PACKS
+    return []
+
+# packed_suffix: [data, alpha, [R, G, B, A]]
+#   channel: ['source_suffix', source_channel, 'fallback_input', fallback_value, 'transfer']
+#     source_suffix: the baked map to read the channel from (None for a constant channel)
+#     fallback_input: the BSDF input to take the value from when there is no baked map
+#     fallback_value: the value to use when there is no baked map or BSDF input
+#     transfer: an optional function applied to the channel (see packer.TRANSFER_FUNCTIONS)
+#   channel: None keeps the existing channel values in the target image
+CHANNEL_PACKS = {
+    # BaseMap: RGB: diffuse, A: alpha
+    "BaseMap": [False, True, [
+        ["Diffuse", 0, "Base Color", 1.0, None],
+        ["Diffuse", 1, "Base Color", 1.0, None],
+        ["Diffuse", 2, "Base Color", 1.0, None],
+        ["Alpha", 0, None, 1.0, None],
+    ]],
+
+    # Mask: R: Metallic, G: AO, B: Micro-Normal Mask, A: Smoothness = f(Roughness)
+    "Mask": [True, True, [
+        ["Metallic", 0, "Metallic", 0.0, None],
+        ["AO", 0, None, 1.0, None],
+        ["MicroNormalMask", 0, None, 1.0, None],
+        ["Roughness", 0, "Roughness", 0.0, "SMOOTHNESS"],
+    ]],
+
+    # Detail: R: 0.5, G: Micro-Normal.R, B: 0.5, A: Micro-Normal.G
+    "Detail": [True, True, [
+        [None, 0, None, 0.5, None],
+        ["MicroNormal", 0, None, 0.5, None],
+        [None, 0, None, 0.5, None],
+        ["MicroNormal", 1, None, 0.5, None],
+    ]],
+
+    # MetallicAlpha: RGB: Metallic, A: Smoothness = f(Roughness)
+    "MetallicAlpha": [True, True, [
+        ["Metallic", 0, "Metallic", 0.0, None],
+        ["Metallic", 0, "Metallic", 0.0, None],
+        ["Metallic", 0, "Metallic", 0.0, None],
+        ["Roughness", 0, "Roughness", 0.5, "SMOOTHNESS"],
+    ]],
+
+    # GLTF: R: AO, G: Roughness, B: Metallic
+    "GLTF": [True, False, [
+        ["AO", 0, None, 1.0, None],
+        ["Roughness", 0, "Roughness", 0.0, None],
+        ["Metallic", 0, "Metallic", 0.0, None],
+        None,
+    ]],
+}
+
+GLTF_PACKS = ["BaseMap", "GLTF"]
+UNITY_URP_PACKS = ["BaseMap", "MetallicAlpha"]
+UNITY_HDRP_PACKS = ["BaseMap", "Mask", "Detail"]
+
+
 TEX_LIST = [
         ("64","64 x 64","64 x 64 texture size"),
         ("128","128 x 128","128 x 128 texture size"),
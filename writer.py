@@ -0,0 +1,132 @@
+import os
+import zlib
+import struct
+import threading
+import numpy
+from concurrent.futures import ThreadPoolExecutor
+
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# rows filtered at a time, bounds the memory of the filter candidates
+PNG_FILTER_BAND_ROWS = 256
+
+
+def make_png_chunk(chunk_type, data):
+    chunk = chunk_type + data
+    return struct.pack(">I", len(data)) + chunk + struct.pack(">I", zlib.crc32(chunk) & 0xffffffff)
+
+
+def filter_png_rows(data, bpp):
+    """Returns the PNG scanlines of the (height, row bytes) uint8 data, each with its filter type byte in front.
+
+    Each row uses whichever of the None, Sub, Up, Average or Paeth filters has the smallest sum of
+    absolute differences, the same adaptive heuristic libpng uses, so the files compress as well as Blender's.
+    """
+
+    height, row_bytes = data.shape
+    rows = numpy.empty((height, row_bytes + 1), dtype=numpy.uint8)
+    for start in range(0, height, PNG_FILTER_BAND_ROWS):
+        end = min(height, start + PNG_FILTER_BAND_ROWS)
+        x = data[start:end].astype(numpy.int16)
+        up = numpy.zeros_like(x)
+        if start > 0:
+            up[0] = data[start - 1]
+        up[1:] = x[:-1]
+        left = numpy.zeros_like(x)
+        left[:, bpp:] = x[:, :-bpp]
+        up_left = numpy.zeros_like(x)
+        up_left[:, bpp:] = up[:, :-bpp]
+        p = left + up - up_left
+        pa = numpy.abs(p - left)
+        pb = numpy.abs(p - up)
+        pc = numpy.abs(p - up_left)
+        paeth = numpy.where((pa <= pb) & (pa <= pc), left, numpy.where(pb <= pc, up, up_left))
+        del p, pa, pb, pc
+
+        band = rows[start:end]
+        best = None
+        for filter_type, predicted in enumerate([None, left, up, (left + up) >> 1, paeth]):
+            filtered = x if predicted is None else (x - predicted) & 0xff
+            # the sum of the filtered bytes as signed values
+            score = numpy.minimum(filtered, 256 - filtered).sum(axis=1, dtype=numpy.int64)
+            better = numpy.ones(len(score), dtype=bool) if best is None else score < best
+            if best is None:
+                best = score
+            else:
+                best = numpy.where(better, score, best)
+            band[better, 0] = filter_type
+            band[better, 1:] = filtered[better]
+    return rows
+
+
+def encode_png(pixels, width, height, channels, png_channels, compression):
+    """Returns the 8 bit PNG file of the flat float pixels, stored bottom row first as Blender does.
+
+    compression: 0 - 100 as the Blender PNG compression setting.
+    zlib releases the GIL while compressing, so this runs in parallel on a thread pool.
+    """
+
+    data = numpy.rint(numpy.clip(pixels, 0.0, 1.0) * 255).astype(numpy.uint8)
+    data = data.reshape(height, width, channels)[::-1, :, :png_channels]
+    rows = filter_png_rows(numpy.ascontiguousarray(data).reshape(height, width * png_channels), png_channels)
+    # truncated, as Blender does, so both write paths give the same zlib level
+    level = min(9, max(0, int(compression / 11.1111)))
+    color_type = 6 if png_channels == 4 else 2
+    header = struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)
+    return (PNG_SIGNATURE +
+            make_png_chunk(b"IHDR", header) +
+            make_png_chunk(b"IDAT", zlib.compress(rows.tobytes(), level)) +
+            make_png_chunk(b"IEND", b""))
+
+
+def write_file(path, data):
+    """Writes the file through a temporary file, so a failed write never leaves a partial image."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as file:
+        file.write(data)
+    os.replace(temp_path, path)
+    return len(data)
+
+
+def encode_and_write_png(path, pixels, width, height, channels, png_channels, compression):
+    return write_file(path, encode_png(pixels, width, height, channels, png_channels, compression))
+
+
+class ImageWriter:
+    """Encodes and writes images on a thread pool, while the bake carries on with the next map.
+
+    At most queue_size images are waiting or being written at once, submit() blocks until
+    there is room, so the pixel buffers held in memory stay bounded.
+    Writes to the same file are made in the order submitted.
+    """
+
+    def __init__(self, threads, queue_size):
+        self.executor = ThreadPoolExecutor(max_workers=max(1, threads))
+        self.slots = threading.BoundedSemaphore(max(1, queue_size))
+        self.in_flight = {}
+
+    def submit_png(self, path, pixels, width, height, channels, png_channels, compression):
+        """Queues the pixels to be written to path as a PNG, returns the future of the bytes written."""
+        previous = self.in_flight.get(path)
+        if previous:
+            # the earlier write must land first, the caller collects any error from its future
+            try:
+                previous.result()
+            except:
+                pass
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(encode_and_write_png, path, pixels, width, height,
+                                          channels, png_channels, compression)
+        except:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda f: self.slots.release())
+        self.in_flight[path] = future
+        return future
+
+    def shutdown(self):
+        """Waits for every write to finish."""
+        self.executor.shutdown(wait=True)
+        self.in_flight.clear()